@@ -7,10 +7,16 @@
 #There are four main classes, to separate the tasks roughly along the Model, View, Control type
 #of design pattern.  The classes are as follows:
 # Matrix - A generic matrix object to store and manipulate a two-dimensional array
+# SparseMatrix - A version of Matrix that only stores occupied cells, for large boards
+# Rules - The variants of the game: standard, Keryo, Gomoku and the tournament opening rule
+# Patterns - Lookup tables of what a move does to each line through it, cached in the user's cache directory
 # PenteModel - The mathematical model that performs analysis/statistics of the pente game
 # PenteView - The GUI for the game.  Implemented here using PyGame, but could use any GUI framework
+# SoundBank - Loads the sound effects when they're first needed, and plays them
 # PenteGame - The game state variables, that keeps track of players and who is winning, etc.
 # PenteAI - The Artificial Intelligence class that allows the computer to calculate moves and compete against another player
+# PenteSolver - Proof-number search, to find forced wins
+# BoardPool - Positions kept in shared memory, for analysis by several processes at once
 
 #These constants are all related to the View, but for now we'll make them globals,
 #just because it's easier and makes for cleaner looking code. Eventually these should
@@ -39,19 +45,33 @@
 
 # import necessary modules
 import pygame
-from random import randint
+import os
+import ConfigParser
+import sys
+import time
+import threading
+import Queue
+import tempfile
+from multiprocessing import sharedctypes
+from random import Random
 from pygame.locals import *
-import copy
+from array import array
+try:
+    import numpy   #only needed for the batched evaluation API, BatchEvaluate() and BoardPool.Boards()
+except ImportError:
+    numpy = None
 
 # debug switch
 DEBUG = False
 #DEBUG = True
 if DEBUG:
-    import os
     os.chdir("D:\\gamoto\\python\\pente\\dist")
 else:
-    import psyco
-    psyco.full()
+    try:
+        import psyco
+        psyco.full()
+    except ImportError:
+        pass  #psyco is only a speedup, run without it if it's not installed
     
 # define color constants
 BLACK = pygame.color.Color('black')
@@ -69,16 +89,38 @@ if DEBUG:
     SIZE=10
 else:
     SIZE=13
+SPARSESIZE=19  #boards larger than this are stored as a SparseMatrix
 BOARDSIZE=400
 HUMAN=0     #human is player 1
 COMPUTER=1  #computer is player 2
 LINEWIDTH=2
-CELLSIZE = BOARDSIZE/(SIZE-1)
 BMARGIN=50  #bottom margin
 LMARGIN=50  #left margin
 RMARGIN=50  #right margin
 TMARGIN=20   #top margin
 STATUSHEIGHT = 35  #height of status line at bottom
+FRAMERATE = 30  #maximum number of screen updates per second
+AITHINK = USEREVENT  #timer event, to check on the computer while it's thinking
+SOUNDFILES = {"P1click":"QABITEM.WAV",               #player 1 places a piece
+              "P2click":"Windows XP Balloon.wav",    #player 2 places a piece
+              "laugh":"giddylaugh.wav",              #computer captures
+              "ohhh":"ohhh.wav"}                     #human captures
+#define game constants
+MAXRUN = 5       #run length that wins the game
+MAXCAPTURES = 5  #number of captures that wins the game
+DIRECTIONS = [(0,1),(1,0),(1,1),(-1,1)]  #row,col steps for right, down, diagonal down-right, diagonal up-right
+RANDOM = Random()  #random numbers for PenteAI to break ties with, unless it's given its own
+
+class _Blank:
+    pass
+def _ShallowCopy(obj):
+    #returns a new instance of obj's class sharing all of obj's attributes.  Unlike copy.copy this
+    #doesn't go through __getstate__/__setstate__, which our classes use to pickle just what can't
+    #be worked out again, and which would do all that work again on every copy
+    result = _Blank()
+    result.__class__ = obj.__class__
+    result.__dict__.update(obj.__dict__)
+    return result
     
 class Matrix:
     """A generic matrix object to store and manipulate a square two-dimensional array.
@@ -86,7 +128,9 @@ class Matrix:
     and filler is what to fill it with upon creation.
     Note that this matrix uses [row][col] notation, but also maintains x & y indices,
     so matrix[r][c] = matrix[y][x].  When iterating, these indices are updated, allowing
-    you to know 'where you are' during an iteration loop."""
+    you to know 'where you are' during an iteration loop.  Because those indices are shared,
+    two loops over the same matrix (nested, or in different threads) get in each other's
+    way; Cells() gives the position along with each value and doesn't change the matrix."""
     def __init__(self,msize,filler):
         #create matrix filled with filler values
         self.matrix = [[filler for i in range(msize)] for j in range(msize)]
@@ -104,11 +148,75 @@ class Matrix:
                 self.x += 1
             self.row += 1
             self.y += 1
+    def Cells(self):
+        #generates (row,col,value) for every cell, in row order, without using the iterator indices
+        for r,row in enumerate(self.matrix):
+            for c,cell in enumerate(row):
+                yield r,c,cell
+    def __getitem__(self,cell):
+        #allows matrix[row,col] syntax, or matrix[cell] for a (row,col) tuple
+        return self.matrix[cell[0]][cell[1]]
+    def __setitem__(self,cell,v):
+        self.matrix[cell[0]][cell[1]] = v
     def Clear(self):
         #Clear all cells in the matrix
         for x in range(self.size):
             for y in range(self.size):
                 self.matrix[x][y]=0
+    def Copy(self):
+        #returns a new matrix with the same cells
+        result = _ShallowCopy(self)
+        result.matrix = [row[:] for row in self.matrix]
+        return result
+    def __getstate__(self):
+        #pickle the cells as a string of bytes (or ints, if they don't fit in a byte, e.g. votes).
+        #Anything else (big numbers, floats, None...) is pickled as it is
+        cells = [cell for row in self.matrix for cell in row]
+        for typecode in 'b','i':
+            try:
+                packed = array(typecode,cells)
+            except (OverflowError,TypeError):
+                continue
+            return self.size,typecode,packed.tostring()
+        return self.size,None,self.matrix
+    def __setstate__(self,state):
+        self.size,typecode,data = state
+        if typecode is None:
+            self.matrix = data
+        else:
+            cells = array(typecode)
+            cells.fromstring(data)
+            self.matrix = [cells[r*self.size:(r+1)*self.size].tolist() for r in range(self.size)]
+        self.x=self.col=0
+        self.y=self.row=0
+    def Pieces(self):
+        #returns list of (row,col,value) for each non-empty cell, in row order
+        result=[]
+        for r in range(self.size):
+            row = self.matrix[r]
+            for c in range(self.size):
+                if row[c]:
+                    result.append((r,c,row[c]))
+        return result
+    def Candidates(self):
+        #returns list of (row,col) for every empty cell, in row order
+        result=[]
+        for r in range(self.size):
+            row = self.matrix[r]
+            for c in range(self.size):
+                if not row[c]:
+                    result.append((r,c))
+        return result
+    def CheckRun(self,row,col,dr,dc,n,v):
+        #Given starting cell row,col, direction dr,dc, number of cells n and value v,
+        #checks if all n cells heading in that direction have value v
+        endrow,endcol = row+(n-1)*dr,col+(n-1)*dc
+        if endrow<0 or endrow>=self.size or endcol<0 or endcol>=self.size:
+            return False  #not enough room
+        for i in range(0,n):
+            if self.matrix[row+i*dr][col+i*dc] <> v:
+                return False
+        return True
     def CheckRight(self,n,v):
         #Given number of cells n and value v, checks if cells to the right of current position are occupied (including current position)
         if (self.size-self.col<n):
@@ -142,56 +250,460 @@ class Matrix:
                 return False
         return True
     
+class SparseMatrix:
+    """A sparse version of Matrix for large boards, where most of the cells are empty.
+    Constructor takes the size of the board.  Only the non-empty cells are stored, in a
+    dictionary keyed by (row,col), along with the bounding box of those cells, so the cost
+    of scanning the board depends on the number of pieces rather than the size of the board.
+    Supports the same matrix[row,col] syntax as Matrix; cells off the board read as empty."""
+    def __init__(self,msize):
+        self.size = msize
+        self.cells = {}      #(row,col):value for each non-empty cell
+        self.bounds = None   #minrow,mincol,maxrow,maxcol of non-empty cells, None if not known
+    def __getitem__(self,cell):
+        return self.cells.get(cell,0)
+    def __setitem__(self,cell,v):
+        if v:
+            self.cells[cell] = v
+            if self.bounds:
+                minrow,mincol,maxrow,maxcol = self.bounds
+                self.bounds = min(minrow,cell[0]),min(mincol,cell[1]),max(maxrow,cell[0]),max(maxcol,cell[1])
+        elif cell in self.cells:
+            del self.cells[cell]
+            self.bounds = None  #the box may have shrunk, work it out again when needed
+    def Clear(self):
+        self.cells.clear()
+        self.bounds = None
+    def Copy(self):
+        #returns a new matrix with the same cells
+        result = _ShallowCopy(self)
+        result.cells = self.cells.copy()
+        return result
+    def Bounds(self):
+        #returns minrow,mincol,maxrow,maxcol of the non-empty cells, or None if the board is empty
+        if self.bounds is None and self.cells:
+            rows = [cell[0] for cell in self.cells]
+            cols = [cell[1] for cell in self.cells]
+            self.bounds = min(rows),min(cols),max(rows),max(cols)
+        return self.bounds
+    def Cells(self):
+        #generates (row,col,value) for every cell, in row order (see Matrix.Cells)
+        for r in xrange(self.size):
+            for c in xrange(self.size):
+                yield r,c,self.cells.get((r,c),0)
+    def Pieces(self):
+        #returns list of (row,col,value) for each non-empty cell, in row order
+        return [(cell[0],cell[1],v) for cell,v in sorted(self.cells.items())]
+    def Candidates(self,margin=2):
+        #returns list of (row,col) for the empty cells within margin of the bounding box,
+        #or the center cell if the board is empty
+        bounds = self.Bounds()
+        if bounds is None:
+            return [(self.size/2,self.size/2)]
+        minrow,mincol,maxrow,maxcol = bounds
+        result=[]
+        for r in range(max(0,minrow-margin),min(self.size,maxrow+margin+1)):
+            for c in range(max(0,mincol-margin),min(self.size,maxcol+margin+1)):
+                if not (r,c) in self.cells:
+                    result.append((r,c))
+        return result
+    def CheckRun(self,row,col,dr,dc,n,v):
+        #Given starting cell row,col, direction dr,dc, number of cells n and value v,
+        #checks if all n cells heading in that direction have value v
+        for i in range(0,n):
+            if self.cells.get((row+i*dr,col+i*dc)) <> v:
+                return False  #cells off the board are never stored, so they never match
+        return True
+
+# -------------------------------------------------------
+# Rules
+# The variants of the game differ in what can be captured, how many captures win, and where the
+# first player may put their second piece.  Everything else (five in a row wins, players take
+# turns placing one piece) is the same for all of them.
+
+class Rules:
+    """A set of rules.  Constructor takes:
+    name        - used to tell rule sets apart, e.g. in the names of pattern files
+    captures    - the lengths of lines of the opponent's pieces that are captured by putting a piece at
+                  each end of them, e.g. (2,) for pairs
+    capturewin  - the number of captures that wins the game, or None if captures can't win
+    countstones - True to count each piece captured towards capturewin, False to count each capture
+    tournament  - True for the tournament opening rule: the first player's first piece goes in the
+                  center, and their second piece at least three cells away from it"""
+    def __init__(self,name,captures=(2,),capturewin=MAXCAPTURES,countstones=False,tournament=False):
+        self.name = name
+        self.captures = tuple(captures)
+        self.capturewin = capturewin
+        self.countstones = countstones
+        self.tournament = tournament
+
+    def __repr__(self):
+        return "Rules(%r)" % self.name
+
+    def CaptureValue(self,n):
+        #what capturing n pieces counts towards capturewin
+        if self.countstones:
+            return n
+        return 1
+
+    def Pieces(self,captures):
+        #the number of pieces taken to make a capture count of captures (roughly, if captures of
+        #different sizes are each counted as 1)
+        if self.countstones:
+            return captures
+        return captures*min(self.captures or (2,))
+
+    def Signature(self):
+        #list of numbers describing the rules that affect the pattern tables
+        return [sum([1<<n for n in self.captures]),int(self.countstones)]
+
+STANDARD = Rules("standard")                  #pairs are captured, 5 captures win
+KERYO = Rules("keryo",captures=(2,3),capturewin=15,countstones=True)  #pairs or threes, 15 pieces win
+GOMOKU = Rules("gomoku",captures=(),capturewin=None)  #no captures, five (or more) in a row wins
+TOURNAMENT = Rules("tournament",tournament=True)      #standard rules with the tournament opening rule
+RULES = {}
+for rules in STANDARD,KERYO,GOMOKU,TOURNAMENT:
+    RULES[rules.name] = rules
+
+# -------------------------------------------------------
+# Line patterns
+# What a piece placed on a cell does to each of the four lines through it depends only on the
+# PATTERNDEPTH cells on either side of it.  Each of those cells is EMPTY, OWN (a piece belonging to
+# the player placing the piece), OPP (the other player's piece) or EDGE (off the board), 2 bits
+# per cell.  A pattern key holds the cells in the order they appear along the line, skipping the
+# center cell: bits 0-9 are the cells before it (farthest first), bits 10-19 the cells after it
+# (nearest first).  PATTERNS[key] and PATTERNFLAGS[key] describe what placing a piece in the
+# center does to that line, and are looked up with Patterns().
+EMPTY,OWN,OPP,EDGE = 0,1,2,3
+PATTERNDEPTH = 5
+# threat classes, bits in PATTERNFLAGS: the piece makes...
+FIVE = 1            # five (or more) in a row
+OPENFOUR = 2        # four in a row with both ends empty
+FOUR = 4            # four in a row
+OPENTHREE = 8       # three in a row with both ends empty
+SPLITTHREE = 16     # three in four cells with a gap in the middle, and both ends empty
+CAPTURE = 32        # a capture
+CAPTURETHREAT = 64  # opponent pieces that can be captured next turn
+# fields in PATTERNS: the change in the number of runs of three, runs of four, open runs of
+# three, open runs of four and runs of five (counted the way CalcStats counts them), and the
+# captures (counted the way the rules count them).  Each field is 5 bits (the last one takes the
+# rest of the word) with a bias of 2, so the values for the four lines through a cell can be added
+# up and the totals read back with PatternField().  Each set of Rules has its own tables, saved in
+# its own file, e.g. patterns-keryo.dat; the standard ones are in patterns.dat.  The files go in the
+# first of PATTERNDIRS we can write to: the user's cache directory, or the temp directory
+PF_THREES,PF_FOURS,PF_OPENTHREES,PF_OPENFOURS,PF_FIVES,PF_CAPTURES = 0,5,10,15,20,25
+if os.environ.get("LOCALAPPDATA"):
+    PATTERNDIRS = [os.path.join(os.environ["LOCALAPPDATA"],"pente")]  #windows
+else:
+    PATTERNDIRS = [os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),"pente")]
+PATTERNDIRS.append(os.path.join(tempfile.gettempdir(),"pente"))
+CONFIGFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),"pente.cfg")
+PATTERNVERSION = 2  #change this when the tables change, so old files are regenerated
+
+def PatternField(total,field,lines=4):
+    #returns a field from the total of the PATTERNS values for a number of lines
+    if field==PF_CAPTURES:
+        return (total >> field) - 2*lines
+    return ((total >> field) & 31) - 2*lines
+
+def PlayerKey(key,p):
+    #converts a pattern key for player 0 (whose pieces are 1 on the board) to one for player p
+    if p:
+        return ((key & 0x55555) << 1) | ((key >> 1) & 0x55555)  #swap OWN and OPP
+    return key
+
+def MakePatterns(rules=STANDARD):
+    #work out the PATTERNS and PATTERNFLAGS tables for every possible key
+    def windows(n):
+        return max(0,n-MAXRUN+1)
+    #describe each side of the center cell: cells nearest first, run of OWN pieces next to the
+    #center, whether the cell past that run is empty, and capture patterns
+    sides = []
+    for side in range(1024):
+        cells = [(side >> 2*i) & 3 for i in range(PATTERNDEPTH)]
+        run = 0
+        while run < PATTERNDEPTH and cells[run]==OWN:
+            run += 1
+        isopen = run < PATTERNDEPTH and cells[run]==EMPTY
+        capture = threat = 0
+        for n in rules.captures:
+            if cells[:n]==[OPP]*n:
+                if cells[n]==OWN:
+                    capture = rules.CaptureValue(n)
+                elif cells[n]==EMPTY:
+                    threat = 1
+        sides.append((cells,run,isopen,capture,threat))
+    #the cells before the center are stored farthest first, so reverse them
+    before = [sides[sum([((k >> 2*(4-i)) & 3) << 2*i for i in range(PATTERNDEPTH)])] for k in range(1024)]
+    values = array('i',[0])*(1<<20)
+    flags = array('B',[0])*(1<<20)
+    for l in range(1024):
+        lcells,a,oa,lcapture,lthreat = before[l]
+        for r in range(1024):
+            rcells,b,ob,rcapture,rthreat = sides[r]
+            n = a+b+1   #length of the run through the center
+            threes = (n==3)-(a==3)-(b==3)
+            fours = (n==4)-(a==4)-(b==4)
+            openthrees = (n==3 and oa and ob)-(a==3 and oa)-(b==3 and ob)
+            openfours = (n==4 and oa and ob)-(a==4 and oa)-(b==4 and ob)
+            fives = windows(n)-windows(a)-windows(b)
+            captures = lcapture+rcapture
+            f = 0
+            if n>=MAXRUN:
+                f |= FIVE
+            elif n==4:
+                f |= FOUR
+                if oa and ob:
+                    f |= OPENFOUR
+            elif n==3:
+                if oa and ob:
+                    f |= OPENTHREE
+            else:
+                #look for X_XX or XX_X, with the center as one of the X's
+                line = lcells[3::-1]+[OWN]+rcells[:4]
+                for i in range(1,5):
+                    w = line[i:i+4]
+                    if w[0]==OWN and w[3]==OWN and w.count(OWN)==3 and w.count(EMPTY)==1 \
+                       and line[i-1]==EMPTY and line[i+4]==EMPTY:
+                        f |= SPLITTHREE
+            if captures:
+                f |= CAPTURE
+            if lthreat or rthreat:
+                f |= CAPTURETHREAT
+            key = l | r<<10
+            values[key] = (threes+2)<<PF_THREES | (fours+2)<<PF_FOURS | (openthrees+2)<<PF_OPENTHREES | \
+                          (openfours+2)<<PF_OPENFOURS | (fives+2)<<PF_FIVES | (captures+2)<<PF_CAPTURES
+            flags[key] = f
+    return values,flags
+
+_patterns = {}
+_patternlock = threading.Lock()  #so two threads don't both work out the same tables
+def Patterns(rules=STANDARD):
+    #returns the PATTERNS and PATTERNFLAGS tables for a set of rules.  They're read from a file, or
+    #worked out (which takes a few seconds, so the game starts on them in the background) and saved
+    #there the first time they're needed.  Rules that only differ in things the tables don't
+    #depend on (like the tournament opening rule) share the standard ones
+    signature = tuple(rules.Signature())
+    _patternlock.acquire()
+    try:
+        if not signature in _patterns:
+            _patterns[signature] = _LoadPatterns(rules)
+    finally:
+        _patternlock.release()
+    return _patterns[signature]
+
+_loaders = {}   #signature:thread loading the tables, for PreloadPatterns
+def PreloadPatterns(rules=STANDARD):
+    #returns the tables for a set of rules if they're loaded, like Patterns(), but never waits for
+    #them: if they aren't, starts loading them in the background (unless that's already started)
+    #and returns None
+    signature = tuple(rules.Signature())
+    if signature in _patterns:
+        return _patterns[signature]
+    if not signature in _loaders:
+        loader = threading.Thread(target=Patterns,args=(rules,))
+        loader.setDaemon(True)  #don't keep the program running just to finish the tables
+        _loaders[signature] = loader
+        loader.start()
+    return None
+
+def _LoadPatterns(rules):
+    name = "patterns.dat"
+    if tuple(rules.Signature()) <> tuple(STANDARD.Signature()):
+        name = "patterns-%s.dat" % rules.name
+    header = array('i',[PATTERNVERSION]+rules.Signature())
+    for directory in PATTERNDIRS:
+        try:
+            f = open(os.path.join(directory,name),"rb")
+            try:
+                saved = array('i')
+                saved.fromfile(f,len(header))
+                if saved <> header:
+                    continue  #old pattern file
+                values = array('i')
+                values.fromfile(f,1<<20)
+                flags = array('B')
+                flags.fromfile(f,1<<20)
+                return values,flags
+            finally:
+                f.close()
+        except (IOError,EOFError):
+            pass
+    values,flags = MakePatterns(rules)
+    for directory in PATTERNDIRS:
+        filename = os.path.join(directory,name)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            f = open(filename,"wb")
+            try:
+                header.tofile(f)
+                values.tofile(f)
+                flags.tofile(f)
+            finally:
+                f.close()
+            return values,flags
+        except (IOError,OSError):
+            pass  #try the next place
+    sys.stderr.write("Can't save the pattern tables in %s, they'll be worked out again next time\n" %
+                     " or ".join(PATTERNDIRS))
+    return values,flags
+
+class Run(object):
+    #a run of n pieces in a row, starting at row,col and heading in direction dr,dc (one of DIRECTIONS).
+    #CalcStats makes a lot of these, so they only store where the run is rather than a list of its
+    #cells (__slots__ needs a new-style class).  Iterating over a run gives the coords of its cells
+    __slots__ = ('row','col','dr','dc','n')
+    def __init__(self,row,col,dr,dc,n):
+        self.row,self.col,self.dr,self.dc,self.n = row,col,dr,dc,n
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        for i in xrange(self.n):
+            yield self.row+i*self.dr,self.col+i*self.dc
+
+    def __contains__(self,cell):
+        row,col = cell
+        i = max(abs(row-self.row),abs(col-self.col))  #steps from the start of the run
+        return i<self.n and row==self.row+i*self.dr and col==self.col+i*self.dc
+
+    def __repr__(self):
+        return "Run(%d,%d,%d,%d,%d)" % (self.row,self.col,self.dr,self.dc,self.n)
+
+    def End(self):
+        #returns the coords of the last cell in the run
+        return self.row+(self.n-1)*self.dr,self.col+(self.n-1)*self.dc
+
 class PenteModel:
-    def __init__(self,size,numplayers=2):
-        self.MAXRUN = 5
-        self.MAXCAPTURES = 5
+    def __init__(self,size,numplayers=2,sparse=None,rules=STANDARD):
+        self.rules = rules
+        self.MAXRUN = MAXRUN
+        self.MAXCAPTURES = rules.capturewin
         # create a game grid
-        self.M = Matrix(size,0)  #grid that holds pieces on board
+        if sparse is None:
+            sparse = size > SPARSESIZE  #only worth it for large boards
+        if sparse:
+            self.M = SparseMatrix(size)  #grid that holds pieces on board
+        else:
+            self.M = Matrix(size,0)  #grid that holds pieces on board
         self.size = size
         self.NumPlayers = numplayers
         self.wins = [0,0]
+        # listeners to notify when things happen in the game, e.g. for sounds and screen updates.
+        # Append a function to any of these lists; nothing is called if the lists are empty.
+        self.on_place = []     # on_place(row,col,p) when player p places a piece
+        self.on_capture = []   # on_capture(p,run) when player p captures the pieces in run (a Run)
+        self.on_win = []       # on_win(p) when player p wins the game
+        self.on_reset = []     # on_reset() when the board is cleared for a new game
         self.Reset()
 
+    def Clone(self):
+        # returns an independent copy of the game, e.g. for the AI to think about.  Only the board
+        # and the small things that change during a game are copied; the run lists are shared until
+        # CalcStats replaces them (it never changes a list of runs, it makes a new one).
+        # Copies of the model don't notify our listeners
+        result = _ShallowCopy(self)
+        result.M = self.M.Copy()
+        result.Lines = dict([(d,lines[:]) for d,lines in self.Lines.items()])
+        if self.empty is not None:
+            result.empty = set(self.empty)
+        result.Runs = [runs[:] for runs in self.Runs]
+        result.Captures = self.Captures[:]
+        result.wins = self.wins[:]
+        result.on_place,result.on_capture,result.on_win,result.on_reset = [],[],[],[]
+        return result
+
+    def __deepcopy__(self,memo):
+        return self.Clone()
+
+    def __getstate__(self):
+        # pickle just the position (e.g. to send it to another process).  The lines and runs are
+        # worked out again when it's unpickled, and listeners aren't pickled at all
+        rules = self.rules
+        if RULES.get(rules.name) is rules:
+            rules = rules.name  #one of the standard sets, just send its name
+        return self.size,self.NumPlayers,self.M,self.Turn,self.Winner,self.Captures,self.wins,self.lastmove, \
+               self.movecount,rules
+
+    def __setstate__(self,state):
+        self.size,self.NumPlayers,self.M,self.Turn,self.Winner,self.Captures,self.wins,self.lastmove, \
+            self.movecount,self.rules = state
+        if isinstance(self.rules,str):
+            self.rules = RULES[self.rules]
+        self.MAXRUN = MAXRUN
+        self.MAXCAPTURES = self.rules.capturewin
+        self.on_place,self.on_capture,self.on_win,self.on_reset = [],[],[],[]
+        self.Runs = [ [0,[],[],[],[],[]],  # player 1 runlist
+                      [0,[],[],[],[],[]] ] # player 2 runlist
+        self.CalcLines()
+        self.CalcStats()
+
     def Reset(self):
         # Reset game state to a new game
         self.Turn = HUMAN   # track whose turn it is; HUMAN goes first
         self.Winner = None
-        self.Captures=[0,0]  #captures for P1,P2
+        self.Captures=[0,0]  #captures for P1,P2 (see Rules.CaptureValue)
+        self.movecount = 0   #number of moves made so far
         self.lastmove = int(self.size/2),int(self.size/2)
         self.M.Clear()
+        self.CalcLines()
         # data structures to count pairs, triplets, etc is as follows:
         # Runs[] holds list of arrays, each containing another list of runs of each size
         # Runs[0] holds runlist for first player
         # Runs[1] holds runlist for second player
         # Runs[0][0]=0
-        # Runs[0][1]=player 1 list of coordinates of single pieces
-        # Runs[0][2]=player 1 list of coordinates of pairs
-        # Runs[0][3]=player 1 list of coordinates of triplets
-        # Runs[0][4]=player 1 list of coordinates of quadruplets
-        # Runs[0][5]=player 1 list of coordinates of pentuplets (gamewinners)
+        # Runs[0][1]=player 1 list of single pieces
+        # Runs[0][2]=player 1 list of pairs
+        # Runs[0][3]=player 1 list of triplets
+        # Runs[0][4]=player 1 list of quadruplets
+        # Runs[0][5]=player 1 list of pentuplets (gamewinners)
+        # each one is a Run
         # initialize run lists
         self.Runs = [ [0,[],[],[],[],[]],  # player 1 runlist
                       [0,[],[],[],[],[]] ] # player 2 runlist
-        
-    def TakeTurn(self,row,col):
-        # make sure no one's used this space
-        if self.M.matrix[row][col]<>0:
+        if self.on_reset:
+            for listener in self.on_reset:
+                listener()
+
+    def LegalMoves(self):
+        # returns a list of (row,col) for every cell the player whose turn it is can put a piece on
+        # (on a sparse board, just the empty cells near the pieces in play), in no particular order
+        if self.empty is None:
+            cells = self.M.Candidates()
+        else:
+            cells = list(self.empty)
+        if self.rules.tournament and self.Turn==HUMAN and self.movecount in (0,2):
+            cells = [(r,c) for r,c in cells if self.Legal(r,c)]
+        return cells
+
+    def Legal(self,row,col):
+        # returns True if the player whose turn it is can put a piece at row,col
+        if self.M[row,col]<>0:
             # this space is in use
+            return False
+        if self.rules.tournament and self.Turn==HUMAN and self.movecount in (0,2):
+            center = int(self.size/2)
+            if self.movecount==0:
+                return (row,col)==(center,center)  #first move goes in the center
+            return abs(row-center)>2 or abs(col-center)>2  #second one outside the middle 5x5
+        return True
+
+    def TakeTurn(self,row,col):
+        # make sure no one's used this space (and the rules allow it)
+        if not self.Legal(row,col):
             return
 
         # place piece in model
         self.PlacePiece(row,col,self.Turn)
         
         # check if this is a capture
-        if self.CheckCaptures(row,col,self.Turn):
-            if self.Turn == COMPUTER:
-                laugh.play()
-            else:
-                ohhh.play()
-                
+        self.CheckCaptures(row,col,self.Turn)
+
         #remember this was the most recent move
         self.lastmove = row,col
+        self.movecount += 1
 
         if DEBUG:
           if self.Turn == COMPUTER:
@@ -205,94 +717,84 @@ class PenteModel:
     def gameWon(self):
         # determine if anyone has won the game
         # ---------------------------------------------------------------
-        for p in range(self.NumPlayers):
-           if len(self.Runs[p][self.MAXRUN])>0 or self.Captures[p]==self.MAXCAPTURES:
-              self.Winner=p
+        # a new run of five can only go through the last piece placed, so just count along the
+        # four lines through it, and look at the captures.  Doesn't need CalcStats (or the pattern
+        # tables, so it never waits for them)
+        winner = self.Winner
+        if winner is None:
+           row,col = self.lastmove
+           v = self.M[row,col]
+           if v:
+              for dr,dc in DIRECTIONS:
+                 n = 1
+                 for dr,dc in (dr,dc),(-dr,-dc):
+                    r,c = row+dr,col+dc
+                    while 0<=r<self.size and 0<=c<self.size and self.M[r,c]==v:
+                       n += 1
+                       r,c = r+dr,c+dc
+                 if n >= self.MAXRUN:
+                    self.Winner = v-1
+           for p in range(self.NumPlayers):
+              if self.MAXCAPTURES is not None and self.Captures[p]>=self.MAXCAPTURES:
+                 self.Winner = p
+        if self.on_win and winner is None and self.Winner is not None:
+            for listener in self.on_win:
+                listener(self.Winner)
 
     def PlacePiece(self,row,col,p):
         # place a piece in the matrix, mark the space as used
-        self.M.matrix[row][col] = p+1
+        self.SetCell(row,col,p+1)
+        if self.on_place:
+            for listener in self.on_place:
+                listener(row,col,p)
         
     def CountRuns(self,p,n,runs):
         #count how many runs of n, of piece p are on the board, for each player
         #Store them in a list of lists global runs[]
         #first define functions to check runs in each direction
         def Nested(run):
-            #check if a run is already nested inside a larger run
-            n=len(run)
-            for ni in range(n+1,self.MAXRUN+1):
-                for runlist in runs[ni]:
-                    for coord in run:
-                        if not coord in runlist:
-                            return False
-                    return True
+            #check if a run is already nested inside any larger run (a run in another direction
+            #can only share one cell with it, so it's enough to check both ends)
+            first,last = (run.row,run.col),run.End()
+            for ni in range(run.n+1,self.MAXRUN+1):
+                for bigger in runs[ni]:
+                    if first in bigger and last in bigger:
+                        return True
             return False
-        
+
         runs[n]=[]
-        for cell in self.M:
-            if n==1 and cell==p:  #single piece
-                run = [(self.M.row,self.M.col)]
-                if not Nested(run):
-                    runs[n].append(run)
-                break
-            if self.M.CheckRight(n,p):
-                run = [(self.M.row,self.M.col+i) for i in range(n)]
-                if not Nested(run):
-                    runs[n].append(run)
-            if self.M.CheckDown(n,p):
-                run = [(self.M.row+i,self.M.col) for i in range(n)]
-                if not Nested(run):
-                    runs[n].append(run)
-            if self.M.CheckDiag1(n,p):
-                run = [(self.M.row+i,self.M.col+i) for i in range(n)]
-                if not Nested(run):
-                    runs[n].append(run)
-            if self.M.CheckDiag2(n,p):
-                run = [(self.M.row-i,self.M.col+i) for i in range(n)]
+        for row,col,cell in self.M.Pieces():
+            if cell<>p:
+                continue
+            if n==1:  #single piece
+                run = Run(row,col,0,1,1)
                 if not Nested(run):
                     runs[n].append(run)
+                continue
+            for dr,dc in DIRECTIONS:
+                if self.M.CheckRun(row,col,dr,dc,n,p):
+                    run = Run(row,col,dr,dc,n)
+                    if not Nested(run):
+                        runs[n].append(run)
         return len(runs[n])
 
     def PickCells(self,m,n):
         #returns coordinates of cells in matrix m, with value of n
-        result=[]
-        for cell in m:
-            if cell==n:
-                result.append((m.row,m.col))
-        return result
+        return [(row,col) for row,col,cell in m.Cells() if cell==n]
 
-    def GetEnds(self,n,run):
+    def GetEnds(self,n,run,empty=False):
         #given a run of length 2-5, returns a list of coords (2, 1 at each end) of the
-        #cells next in each direction. If next cell is off board, don't include that in the list
+        #cells next in each direction. If next cell is off board, don't include that in the list.
+        #If empty is True, leave out cells that are occupied by a game piece too
+        row,col,dr,dc = run.row,run.col,run.dr,run.dc
+        i,pos = self.LinePos(row,col,dr,dc)
+        line = self.Lines[dr,dc][i] >> 2*(pos+PATTERNDEPTH-1)  #the cell before the run is at bit 0
         result=[]
-        ROW=0    #index positions. Row first,
-        COL=1    #then Column
-        START=0  #Starting coordinate point
-        END=n-1  #Ending coordinate point
-        if run[START][COL]==run[START+1][COL]:
-            #vertical run
-            if run[START][ROW]>0:
-                result.append((run[START][ROW]-1,run[START][COL]))
-            if run[END][ROW]<self.size-1:
-                result.append((run[END][ROW]+1,run[START][COL]))
-        if run[START][ROW]==run[START+1][ROW]:
-            #horizontal run
-            if run[START][COL]>0:
-                result.append((run[START][ROW],run[START][COL]-1))
-            if run[END][COL]<self.size-1:
-                result.append((run[START][ROW],run[END][COL]+1))
-        if run[START][ROW]+1==run[START+1][ROW] and run[START][COL]+1==run[START+1][COL]:
-            #diagonal down-right run
-            if run[START][ROW]>0 and run[START][COL]>0:
-                result.append((run[START][ROW]-1,run[START][COL]-1))
-            if run[END][ROW]<self.size-1 and run[END][COL]<self.size-1:
-                result.append((run[END][ROW]+1,run[END][COL]+1))
-        if run[START][COL]+1==run[START+1][COL] and run[START][ROW]-1==run[START+1][ROW]:
-            #diagonal up-right run
-            if run[END][ROW]>0 and run[END][COL]<self.size-1:
-                result.append((run[END][ROW]-1,run[END][COL]+1))
-            if run[START][COL]>0 and run[START][ROW]<self.size-1:
-                result.append((run[START][ROW]+1,run[START][COL]-1))
+        before,after = line & 3,(line >> 2*(n+1)) & 3
+        if before<>EDGE and not (empty and before):
+            result.append((row-dr,col-dc))
+        if after<>EDGE and not (empty and after):
+            result.append((row+n*dr,col+n*dc))
         return result
 
     def GetOpenEnds(self,n,run):
@@ -300,80 +802,141 @@ class PenteModel:
         #cells next in each direction. If next cell is off board, don't include that in the list
         #Same as GetEnds, BUT:
         #If next cell is occupied by a game piece, don't include it in the list
-        ROW=0    #index positions. Row first,
-        COL=1    #then Column
-        START=0  #Starting coordinate point
-        END=n-1  #Ending coordinate point
-        result=[]
-        if run[START][COL]==run[START+1][COL]:
-            #vertical run
-            if run[START][ROW]>0:
-                if self.M.matrix[run[START][ROW]-1][run[START][COL]]==0:
-                    result.append((run[START][ROW]-1,run[START][COL]))
-            if run[END][ROW]<self.size-1:
-                if self.M.matrix[run[END][ROW]+1][run[START][COL]]==0:
-                    result.append((run[END][ROW]+1,run[START][COL]))
-        if run[START][ROW]==run[START+1][ROW]:
-            #horizontal run
-            if run[START][COL]>0:
-                if self.M.matrix[run[START][ROW]][run[START][COL]-1]==0:
-                   result.append((run[START][ROW],run[START][COL]-1))
-            if run[END][COL]<self.size-1:
-                if self.M.matrix[run[START][ROW]][run[END][COL]+1]==0:
-                   result.append((run[START][ROW],run[END][COL]+1))
-        if run[START][ROW]+1==run[START+1][ROW] and run[START][COL]+1==run[1][1]:
-            #diagonal down-right run
-            if run[START][ROW]>0 and run[START][COL]>0:
-                if self.M.matrix[run[START][ROW]-1][run[START][COL]-1]==0:
-                   result.append((run[START][ROW]-1,run[START][COL]-1))
-            if run[END][ROW]<self.size-1 and run[END][COL]<self.size-1:
-                if self.M.matrix[run[END][ROW]+1][run[END][COL]+1]==0:
-                   result.append((run[END][ROW]+1,run[END][COL]+1))
-        if run[START][ROW]-1==run[START+1][ROW] and run[START][COL]+1==run[START+1][COL]:
-            #diagonal up-right run
-            if run[END][ROW]>0 and run[END][COL]<self.size-1:
-                if self.M.matrix[run[END][ROW]-1][run[END][COL]+1]==0:
-                   result.append((run[END][ROW]-1,run[END][COL]+1))
-            if run[START][COL]>0 and run[START][ROW]<self.size-1:
-                if self.M.matrix[run[START][ROW]+1][run[START][COL]-1]==0:
-                   result.append((run[START][ROW]+1,run[START][COL]-1))
-        if run[START][ROW]+1==run[START+1][ROW] and run[START][COL]-1==run[START+1][COL]:
-            #diagonal down-left run
-            if run[END][ROW]<self.size-1 and run[END][COL]>0:
-                if self.M.matrix[run[END][ROW]+1][run[END][COL]-1]==0:
-                   result.append((run[END][ROW]+1,run[END][COL]-1))
-            if run[START][COL]<self.size-1 and run[START][ROW]>0:
-                if self.M.matrix[run[START][ROW]-1][run[START][COL]+1]==0:
-                   result.append((run[START][ROW]-1,run[START][COL]+1))
-        return result
+        return self.GetEnds(n,run,True)
 
     def CheckCaptures(self,row,col,p):
-        #check if any captures have occurred by placing a piece at row,col for given player p
+        #check if any captures have occurred by placing a piece at row,col for given player p,
+        #and returns how many.  A capture is a line of the opponent's pieces, of one of the lengths
+        #in rules.captures, with this piece at one end and another of p's pieces at the other end.
         #note: the piece just placed must be one of the outer pieces (the one doing the capture)
         #because you capture yourself by moving between two pieces
-        for run in self.Runs[(p+1)%self.NumPlayers][2]:
-            endlist = self.GetEnds(2,run)
-            if len(endlist)==2: #make sure the pair is in the open, not at the edge of the board
-              if self.M.matrix[endlist[0][0]][endlist[0][1]]==p+1 and self.M.matrix[endlist[1][0]][endlist[1][1]]==p+1:
-                if (row,col) in endlist: #this move must be one of the end cells
-                    for cell in run:
-                        #TO DO: Add operator overload to matrix, to allow this syntax:
-                        # self.M(cell) = 0
-                        self.M.matrix[cell[0]][cell[1]]=0  #remove pieces
-                    self.Captures[p] += 1
-                    return True
-        return False
+        captures = 0
+        for dr,dc in DIRECTIONS:
+            for dr,dc in (dr,dc),(-dr,-dc):
+                for n in self.rules.captures:
+                    r,c = row+(n+1)*dr,col+(n+1)*dc
+                    if not (0<=r<self.size and 0<=c<self.size) or self.M[r,c]<>p+1:
+                        continue
+                    for i in range(1,n+1):
+                        if self.M[row+i*dr,col+i*dc] in (0,p+1):
+                            break
+                    else:
+                        #list the run heading in one of DIRECTIONS
+                        if (dr,dc) in DIRECTIONS:
+                            run = Run(row+dr,col+dc,dr,dc,n)
+                        else:
+                            run = Run(row+n*dr,col+n*dc,-dr,-dc,n)
+                        for r,c in run:
+                            self.SetCell(r,c,0)  #remove pieces
+                        self.Captures[p] += self.rules.CaptureValue(n)
+                        captures += 1
+                        if self.on_capture:
+                            for listener in self.on_capture:
+                                listener(p,run)
+        return captures
+
+    def CalcLines(self):
+        #Lines[dr,dc] holds every line of cells in direction dr,dc, each one as an integer with 2 bits
+        #per cell (the values in M, so this only works for two players).  That way the pattern around
+        #any cell can be found with a shift and a mask (see LineKey), instead of walking from cell to
+        #cell.  Cells that are off the board, including PATTERNDEPTH cells past each end of the line,
+        #are EDGE.  The lines are kept up to date by SetCell; this works them all out from scratch.
+        #So does the set of empty cells, empty (None on a sparse board, where it would be huge)
+        self.empty = None
+        if not isinstance(self.M,SparseMatrix):
+            self.empty = set(self.M.Candidates())
+        self.Lines = {}
+        width = self.size+2*PATTERNDEPTH
+        for dr,dc in DIRECTIONS:
+            lines = []
+            if dr==0 or dc==0:
+                numlines = self.size
+            else:
+                numlines = 2*self.size-1  #diagonals
+            for i in range(numlines):
+                #find which part of the line is on the board
+                if dr==0 or dc==0:
+                    lo,hi = 0,self.size
+                elif dr==dc:
+                    k = i-self.size+1  #col-row
+                    lo,hi = max(0,k),min(self.size,self.size+k)
+                else:
+                    lo,hi = max(0,i-self.size+1),min(self.size,i+1)
+                lines.append(((1<<2*width)-1) ^ (((1<<2*(hi-lo))-1) << 2*(lo+PATTERNDEPTH)))
+            self.Lines[dr,dc] = lines
+        for row,col,v in self.M.Pieces():
+            for dr,dc in DIRECTIONS:
+                i,pos = self.LinePos(row,col,dr,dc)
+                self.Lines[dr,dc][i] ^= v << 2*(pos+PATTERNDEPTH)
+
+    def LinePos(self,row,col,dr,dc):
+        #returns which of the lines in direction dr,dc goes through row,col, and how far along it the cell is
+        if dc==0:
+            return col,row
+        if dr==0:
+            return row,col
+        if dr==dc:
+            return col-row+self.size-1,col
+        return row+col,col
+
+    def SetCell(self,row,col,v):
+        #put v in cell row,col of M, keeping Lines and empty up to date
+        change = self.M[row,col] ^ v
+        if change:
+            self.M[row,col] = v
+            if self.empty is not None:
+                if v:
+                    self.empty.discard((row,col))
+                else:
+                    self.empty.add((row,col))
+            for dr,dc in DIRECTIONS:
+                i,pos = self.LinePos(row,col,dr,dc)
+                self.Lines[dr,dc][i] ^= change << 2*(pos+PATTERNDEPTH)
+
+    def LineKey(self,row,col,dr,dc):
+        #returns the pattern key (for player 0) of the line through row,col in direction dr,dc
+        i,pos = self.LinePos(row,col,dr,dc)
+        line = self.Lines[dr,dc][i] >> 2*pos  #the cell PATTERNDEPTH before row,col is at bit 0
+        return (line & 0x3ff) | ((line >> 2) & 0xffc00)  #leave out row,col itself
 
     def CalcStats(self):
        for p in range(self.NumPlayers):
          for i in range(self.MAXRUN,0,-1):
            self.CountRuns(p+1,i,self.Runs[p])
 
+class SoundBank:
+    #Plays sound effects, given a dictionary of name:filename.  Each sound is loaded the first time
+    #it's played, and kept for next time.  If there's no mixer (no sound card, or running headless)
+    #or a sound can't be loaded, playing it does nothing.
+    def __init__(self,files):
+        self.files = files
+        self.sounds = {}   #name:loaded sound, or None if it couldn't be loaded
+
+    def Play(self,name):
+        #play the named sound, loading it if this is the first time
+        if not pygame.mixer.get_init():
+            return  #no mixer, no sound
+        if not name in self.sounds:
+            try:
+                self.sounds[name] = pygame.mixer.Sound(self.files[name])
+            except (pygame.error,IOError):
+                self.sounds[name] = None
+        if self.sounds[name]:
+            self.sounds[name].play()
+
+sounds = SoundBank(SOUNDFILES)
+
 class PenteView:
     #Pente View Class, takes Model m and Board size as inputs
+    layers = {}   #cached background & grid surfaces, keyed by board size and window size
+    stones = {}   #cached pre-rendered pieces, keyed by cell size, player and highlight
+    fonts = {}    #cached fonts, keyed by name and point size
+    texts = {}    #cached rendered status lines, keyed by message and color
+
     def __init__(self,m,size):
         self.boardsize = size
         self.model = m
+        self.cellsize = size/(m.size-1)  #spacing between grid lines, for this model's board size
         self.ttt = pygame.display.set_mode ((self.boardsize+LMARGIN+RMARGIN,self.boardsize+TMARGIN+BMARGIN))
         pygame.display.set_caption ('Pente')
         #TO DO: add icon to window frame
@@ -381,6 +944,17 @@ class PenteView:
 #        pygame.display.set_icon(gxicon)
         # create the game board
         self.board = self.initBoard (self.ttt)
+        # remember what's been drawn, so only the parts that change need to be drawn again
+        self.dirty = [self.board.get_rect()]  #areas of the board that need to be copied to the display
+        self.changed = set()                  #cells whose pieces have changed since the last ReDraw
+        self.cleared = True                   #the whole board needs to be redrawn
+        self.lastmove = None                  #most recent move marked on the board surface
+        self.trays = None                     #captures and wins drawn in the margins
+        self.status = None                    #status message drawn on the board surface
+        # have the model tell us which cells change
+        m.on_place.append(self.Placed)
+        m.on_capture.append(self.Captured)
+        m.on_reset.append(self.Cleared)
 
     # declare our support functions
     def drawsquare(self,x,y,size,s):
@@ -394,19 +968,17 @@ class PenteView:
         # draw the squares on surface s
         for y in range(self.model.size-1):
             for x in range(self.model.size-1):
-                self.drawsquare(x*CELLSIZE+LMARGIN,y*CELLSIZE+TMARGIN,CELLSIZE,s)
+                self.drawsquare(x*self.cellsize+LMARGIN,y*self.cellsize+TMARGIN,self.cellsize,s)
 
     def DrawCaptures(self,s,captures):
-        # draw captured pair in margins
+        # draw captured pieces in margins, two to a row
         r = int(LMARGIN/4.7)
         PLAYER1 = 0
         PLAYER2 = 1
-        for i in range(captures[PLAYER1]):
-            pygame.draw.circle(s,PCOLORS[PLAYER2],(5+r,int(5+TMARGIN+i*2.3*r+r)),r,0)
-            pygame.draw.circle(s,PCOLORS[PLAYER2],(int(5+r+2.1*r),int(5+TMARGIN+i*2.3*r+r)),r,0)
-        for i in range(captures[PLAYER2]):
-            pygame.draw.circle(s,PCOLORS[PLAYER1],(5+r+LMARGIN+BOARDSIZE,int(5+TMARGIN+i*2.3*r+r)),r,0)
-            pygame.draw.circle(s,PCOLORS[PLAYER1],(int(5+r+2.1*r+LMARGIN+BOARDSIZE),int(5+TMARGIN+i*2.3*r+r)),r,0)
+        for i in range(self.model.rules.Pieces(captures[PLAYER1])):
+            pygame.draw.circle(s,PCOLORS[PLAYER2],(int(5+r+(i%2)*2.1*r),int(5+TMARGIN+(i/2)*2.3*r+r)),r,0)
+        for i in range(self.model.rules.Pieces(captures[PLAYER2])):
+            pygame.draw.circle(s,PCOLORS[PLAYER1],(int(5+r+(i%2)*2.1*r+LMARGIN+BOARDSIZE),int(5+TMARGIN+(i/2)*2.3*r+r)),r,0)
 
         #Draw hash marks to keep track of wins
         MARKHEIGHT = 25
@@ -429,31 +1001,56 @@ class PenteView:
                    endy = starty - MARKHEIGHT
                    pygame.draw.line(s,BLACK,(startx,starty),(endx,endy),MARKWIDTH)
     
+    def Layer(self,ttt):
+        # returns the static background & grid layer for this board size and window size
+        # it's drawn once, and then just copied onto the board whenever it's needed
+        key = self.model.size,ttt.get_size()
+        if not key in self.layers:
+            layer = pygame.Surface (ttt.get_size())
+            layer = layer.convert()
+            layer.fill (BACKCOLOR)
+            # draw the squares
+            self.DrawSquares(layer)
+            self.layers[key] = layer
+        return self.layers[key]
+
+    def Stone(self,p,highlight=False):
+        # returns the pre-rendered piece for player p, with a dot on it if highlight is set
+        key = self.cellsize,p,highlight
+        if not key in self.stones:
+            r = max(self.cellsize/3,1)
+            stone = pygame.Surface((2*r+1,2*r+1),SRCALPHA,32)
+            stone = stone.convert_alpha()
+            stone.fill((0,0,0,0))
+            pygame.draw.circle (stone, PCOLORS[p], (r,r), r, 0)
+            if highlight:
+                pygame.draw.circle(stone,WHITE,(r,r),2,0)
+            self.stones[key] = stone
+        return self.stones[key]
+
     def initBoard(self,ttt):
         # initialize the board and return it as a variable
         # ---------------------------------------------------------------
         # ttt : a properly initialized pyGame display variable
 
-        # set up the background surface
-        background = pygame.Surface (ttt.get_size())
-        background = background.convert()
-        background.fill (BACKCOLOR)
-
-        # draw the squares
-        self.DrawSquares(background)
+        # set up the background surface, with the squares already drawn
+        background = self.Layer(ttt).copy()
         # return the board (surface)
         return background
 
-    def drawStatus (self,board,turn,winner):
+    def drawStatus (self,board,turn,winner,progress=None):
         # draw the status (i.e., player turn, etc) at the bottom of the board
         # ---------------------------------------------------------------
         # board : the initialized game board surface where the status will
         #         be drawn
+        # progress : (seconds,positions) the computer has spent thinking so far, or None
 
         # determine the status message
         if (winner is None):
             if turn==COMPUTER:
                message = "My Turn... I'm thinking"
+               if progress:
+                   message += " (%.1f sec, %d positions)" % progress
             else:
                 message = "Your Turn"
         else:
@@ -462,24 +1059,51 @@ class PenteView:
             else:
                 message = "Congratulations, you won!  - Click board to start again"
         
-        # render the status message
-        #font = pygame.font.Font(None, 24)
-        font = pygame.font.SysFont("Arial",24)
-        text = font.render(message, 1, BLACK)
+        if message == self.status:
+            return  #already showing this message
+        self.status = message
 
         # copy the rendered message onto the board
-        board.fill (WHITE, (0, BOARDSIZE+TMARGIN+BMARGIN-STATUSHEIGHT, BOARDSIZE+LMARGIN+RMARGIN, STATUSHEIGHT))
-        board.blit(text, (10, BOARDSIZE+TMARGIN+BMARGIN-STATUSHEIGHT))
+        rect = pygame.Rect(0, BOARDSIZE+TMARGIN+BMARGIN-STATUSHEIGHT, BOARDSIZE+LMARGIN+RMARGIN, STATUSHEIGHT)
+        board.blit(self.StatusLine(message,BLACK,rect.size,not progress), rect.topleft)
+        self.dirty.append(rect)
+
+    def Font(self,name,size):
+        # returns the named system font, looking it up only the first time it's used
+        key = name,size
+        if not key in self.fonts:
+            self.fonts[key] = pygame.font.SysFont(name,size)
+        return self.fonts[key]
 
-    def showBoard (self,ttt, board,turn,winner):
-        # redraw the game board on the display
+    def StatusLine(self,message,color,size,cache=True):
+        # returns a status line surface of the given size with the message rendered on it,
+        # rendering each message only the first time it's used (unless cache is off, for
+        # messages that keep changing)
+        key = message,tuple(color),size
+        if not key in self.texts or not cache:
+            line = pygame.Surface(size)
+            line = line.convert()
+            line.fill (WHITE)
+            # render the status message
+            #font = pygame.font.Font(None, 24)
+            line.blit(self.Font("Arial",24).render(message, 1, color), (10,0))  #10 pixels in from the edge
+            if not cache:
+                return line
+            self.texts[key] = line
+        return self.texts[key]
+
+    def showBoard (self,ttt, board,turn,winner,progress=None):
+        # copy the parts of the game board that have changed onto the display
         # ---------------------------------------------------------------
         # ttt   : the initialized pyGame display
         # board : the game board surface
+        # progress : how long the computer has been thinking, see drawStatus
 
-        self.drawStatus (board,turn,winner)
-        ttt.blit (board, (0, 0))
-        pygame.display.flip()
+        self.drawStatus (board,turn,winner,progress)
+        for rect in self.dirty:
+            ttt.blit (board, rect, rect)
+        pygame.display.update(self.dirty)
+        self.dirty = []
 
     def boardPos (self,mouseX, mouseY):
         # given a set of coordinates from the mouse, determine which board space
@@ -489,30 +1113,31 @@ class PenteView:
         # mouseY : the Y coordinate the user clicked
 
         # determine the row the user clicked
-        row = (mouseY-TMARGIN+CELLSIZE/2) / CELLSIZE
+        row = (mouseY-TMARGIN+self.cellsize/2) / self.cellsize
 
         # determine the column the user clicked
-        col = (mouseX-LMARGIN+CELLSIZE/2) / CELLSIZE
+        col = (mouseX-LMARGIN+self.cellsize/2) / self.cellsize
     
         # return the tuple containg the row & column
         return (row,col)
 
-    def drawMove (self,board, boardRow, boardCol, p):
+    def drawMove (self,board, boardRow, boardCol, p, highlight=False):
         # draw a Piece on the board in boardRow, boardCol
         # ---------------------------------------------------------------
         # board     : the game board surface
         # boardRow,
         # boardCol  : the Row & Col in which to draw the piece (0 based)
         # p     : Player (0 or 1)
+        # highlight : mark the piece with a dot (most recent move)
     
         # determine the center of the square
-        centerX = ((boardCol) * CELLSIZE) +LMARGIN
-        centerY = ((boardRow) * CELLSIZE) +TMARGIN
-
-        xs = CELLSIZE/5    
+        centerX = ((boardCol) * self.cellsize) +LMARGIN
+        centerY = ((boardRow) * self.cellsize) +TMARGIN
 
         # draw the appropriate piece
-        pygame.draw.circle (board, PCOLORS[p], (centerX, centerY), CELLSIZE/3, 0)
+        stone = self.Stone(p,highlight)
+        r = stone.get_width()/2
+        board.blit (stone, (centerX-r, centerY-r))
     
     def clickBoard(self):
         # determine where the user clicked and if the space is not already
@@ -522,28 +1147,124 @@ class PenteView:
         if mouseX >= LMARGIN and mouseX <= LMARGIN+BOARDSIZE:
             if mouseY >= TMARGIN and mouseY <= TMARGIN+BOARDSIZE:
                (row, col) = self.boardPos (mouseX, mouseY)
-               self.model.TakeTurn(row,col)
+               if row < self.model.size and col < self.model.size:
+                   self.model.TakeTurn(row,col)
+
+    def CellRect(self,row,col):
+        #returns the rectangle covered by the piece at row,col
+        return pygame.Rect(LMARGIN+col*self.cellsize-self.cellsize/2,TMARGIN+row*self.cellsize-self.cellsize/2,
+                           self.cellsize,self.cellsize)
+
+    def TrayRects(self):
+        #returns the rectangles in the left and right margins, where captures and wins are drawn
+        height = BOARDSIZE+TMARGIN+BMARGIN-STATUSHEIGHT
+        return [pygame.Rect(0,0,LMARGIN,height),pygame.Rect(LMARGIN+BOARDSIZE,0,RMARGIN,height)]
+
+    def Repaint(self,s,rect):
+        #re-draw everything inside rectangle rect onto surface s, and mark it to be updated on the display
+        m = self.model
+        cs = self.cellsize
+        rect = pygame.Rect(rect)
+        s.set_clip(rect)
+        #re-draw the background and squares
+        s.blit (self.Layer(s),rect,rect)
+        #find the rows & columns of the board that overlap the rectangle
+        r0 = max(0,(rect.top-TMARGIN)/cs-1)
+        r1 = min(m.size-1,(rect.bottom-TMARGIN)/cs+1)
+        c0 = max(0,(rect.left-LMARGIN)/cs-1)
+        c1 = min(m.size-1,(rect.right-LMARGIN)/cs+1)
+        #re-draw pieces, with a dot on the most recently placed piece
+        for row in range(r0,r1+1):
+            for col in range(c0,c1+1):
+                if m.M[row,col]:
+                    self.drawMove(s,row,col,m.M[row,col]-1,(row,col)==m.lastmove)
+        self.DrawCaptures(s,m.Captures)
+        if not m.M[m.lastmove]:
+            pygame.draw.circle(s,WHITE,(LMARGIN+m.lastmove[1]*cs,TMARGIN+m.lastmove[0]*cs),2,0)
+        s.set_clip(None)
+        self.dirty.append(rect)
+
+    # model listeners, to keep track of what needs to be re-drawn
+    def Placed(self,row,col,p):
+        self.changed.add((row,col))
+
+    def Captured(self,p,cells):
+        self.changed.update(cells)
+
+    def Cleared(self):
+        self.cleared = True
 
     def ReDraw(self,s):
-        #re-fill the background
-        s.fill (BACKCOLOR)
-        #re-draw game board onto surface s
-        self.DrawSquares(s)
-        #re-draw pieces
-        for cell in self.model.M:
-            if cell:
-                self.drawMove(s,self.model.M.row,self.model.M.col,cell-1)                    
-        self.DrawCaptures(s,self.model.Captures)
-        #draw dot on most recently placed piece
-        pygame.draw.circle(s,WHITE,(LMARGIN+self.model.lastmove[1]*CELLSIZE, \
-                                    TMARGIN+self.model.lastmove[0]*CELLSIZE),2,0)
+        #re-draw the parts of the game board that have changed since the last ReDraw onto surface s:
+        #pieces that were placed or captured, the last-move marker, and the capture trays
+        m = self.model
+        if self.cleared:
+            self.Repaint(s,s.get_rect())
+        else:
+            changed = self.changed
+            if m.lastmove<>self.lastmove:
+                changed.add(m.lastmove)
+                changed.add(self.lastmove)
+            for row,col in changed:
+                self.Repaint(s,self.CellRect(row,col))
+            trays = list(m.Captures),list(m.wins)
+            if trays<>self.trays:
+                for rect in self.TrayRects():
+                    self.Repaint(s,rect)
+        self.changed = set()
+        self.cleared = False
+        self.lastmove,self.trays = m.lastmove,(list(m.Captures),list(m.wins))
 
 class PenteAI:
-    def __init__(self,m):
+    # strategies:
+    A = -500 # move onto a space already taken! (ChooseMove only looks at legal cells, BatchFeatures uses this)
+##    B = 8    # move to the end of an opponent's open pair (start a trap)
+##    C = 10   # move to cap an open three (block a win)
+##    D = 2    # move to cap a one-ended three (keep it from growing)
+##    E = 20   # move to cap any run of four (try to block a win)
+    F = -1   # move to all edge locations (not good for building runs)
+    G = -1    # G+n to move to add an intersection (building complexity and multiple runs), n=number of neighbors
+    H = 1    # H+n to move to block an opponent intersection (defense), n=number of neighbors
+    I = 5   # move to make a threesome (closed on one side) - prevents a trap
+    J = 12    # move to make an open three out of a pair - can lead to a winner
+    K = 4    # move to make four in a row
+    L = 30   # move to make an open four in a row
+    M = 35   # move to make five in a row (win the game)
+    N = 25   # move to prevent an open four opponent pieces
+    O = 25   # move to prevent a run of five opponent pieces
+    P = 10   # move to prevent an open-three opportunity
+    Q = 15   # move to capture an opponent
+    SOLVENODES = 0    # positions to search for a forced win (see PenteSolver), 0 for none.  Off
+                      # by default, as it adds thinking time to every move; set it in pente.cfg
+    MARGIN = 0.01     # seconds to leave before a deadline, to pick the move from the votes
+
+    # These rules have not been implemented yet:
+    #P = 3    # move to one space away from an existing piece of ours (sets up an intersection fill later)
+    #Q = -2   # move to make a closed-end pair (sets up a trap opportunity for opponent)
+    #R = -1   # move to make an open pair (could lead to trap)
+
+    # names of all the weights above, e.g. for reading them from a config file (see ReadWeights)
+    WEIGHTS = ['A','F','G','H','I','J','K','L','M','N','O','P','Q']
+
+    def __init__(self,m,weights=None,player=COMPUTER,rng=None):
+        #weights is a dictionary of weight name:value, for any weights that should be different
+        #from the ones above.  player is the player we're choosing moves for.  rng is a Random to
+        #break ties between equally good moves with, e.g. Random(seed) to make the same moves
+        #every run; by default we share RANDOM
         self.model = m
-        self.votes = Matrix(m.size,0)
+        self.player = player
+        self.rng = rng or RANDOM
+        if weights:
+            for name,value in weights.items():
+                if not name in self.WEIGHTS:
+                    raise ValueError("unknown PenteAI weight %s" % name)
+                setattr(self,name,value)
+        self.votes = [0]*(m.size*m.size)  #votes for each cell, row by row
         self.scores = [i for i in range(self.model.NumPlayers)]
         self.size = m.size
+        self.nodes = 0          #number of positions looked at while choosing the current move
+        self.started = None     #time we started thinking, while a background move is in progress
+        self.moves = Queue.Queue()  #moves chosen by the background thread
     def CaptureSetups(self,m,runs,p):
         #count how many capture setups we have (pairs with opponent on one end)
         result=0
@@ -569,54 +1290,121 @@ class PenteAI:
                 result += 1
         return result
 
-    def MakeMove(self):
-        m=self.model
-        # strategies:
-        A = -500 # move onto a space already taken!
-##        B = 8    # move to the end of an opponent's open pair (start a trap)
-##        C = 10   # move to cap an open three (block a win)
-##        D = 2    # move to cap a one-ended three (keep it from growing)
-##        E = 20   # move to cap any run of four (try to block a win)
-        F = -1   # move to all edge locations (not good for building runs)
-        G = -1    # G+n to move to add an intersection (building complexity and multiple runs), n=number of neighbors
-        H = 1    # H+n to move to block an opponent intersection (defense), n=number of neighbors
-        I = 5   # move to make a threesome (closed on one side) - prevents a trap
-        J = 12    # move to make an open three out of a pair - can lead to a winner
-        K = 4    # move to make four in a row
-        L = 30   # move to make an open four in a row
-        M = 35   # move to make five in a row (win the game)
-        N = 25   # move to prevent an open four opponent pieces
-        O = 25   # move to prevent a run of five opponent pieces
-        P = 10   # move to prevent an open-three opportunity
-        Q = 15   # move to capture an opponent
-        
-        # These rules have not been implemented yet:
-        #P = 3    # move to one space away from an existing piece of ours (sets up an intersection fill later)
-        #Q = -2   # move to make a closed-end pair (sets up a trap opportunity for opponent)
-        #R = -1   # move to make an open pair (could lead to trap)
+    def MakeMove(self,deadline=None):
+        #choose a move and take it (see ChooseMove for the deadline)
+        rm,cm = self.ChooseMove(self.model,deadline)
+        self.model.TakeTurn(rm,cm)
+
+    def StartMove(self,deadline=None):
+        #start choosing a move in a background thread, so the GUI keeps running while we think.
+        #The thread works on its own copy of the model, so the board can still be drawn.
+        #Call PollMove() to collect the move once it's ready (see ChooseMove for the deadline).
+        self.started = time.time()
+        self.nodes = 0
+        m = self.model.Clone()
+        def think():
+            self.moves.put(self.ChooseMove(m,deadline))
+        thread = threading.Thread(target=think)
+        thread.setDaemon(True)  #don't keep the program running if the window is closed
+        thread.start()
+
+    def PollMove(self):
+        #returns the move chosen by StartMove(), or None if we're still thinking
+        try:
+            move = self.moves.get_nowait()
+        except Queue.Empty:
+            return None
+        self.started = None
+        return move
+
+    def Progress(self):
+        #returns (seconds,positions) spent thinking about the move StartMove() is working on,
+        #or None if we're not thinking
+        if self.started is None:
+            return None
+        return time.time()-self.started,self.nodes
+
+    def ChooseMove(self,m,deadline=None):
+        #work out the best move for model m, and return it as (row,col).  If there's a deadline
+        #(a time.time() value) we stop thinking MARGIN seconds before it and go with the best
+        #move so far: the votes we got through, without the forced win search.  The pattern tables
+        #aren't waited for then either; until they're loaded, the run votes are left out
+        self.nodes = 0
+        if deadline is not None:
+            deadline -= self.MARGIN
+        size = m.size
+        if len(self.votes)<>size*size:
+            self.votes = [0]*(size*size)
+        votes = self.votes
+
+        # only consider cells the rules let us move to (on a sparse board, only the ones near the
+        # pieces in play).  Votes for any other cell are never looked at, so only these are cleared
+        cells = m.LegalMoves()
+        if not cells:
+            return m.lastmove  #board's full, there's nowhere to go
+        for r,c in cells:
+            votes[r*size+c]=0
+        finished = self.Vote(m,cells,deadline)
+
+        # if we can see a forced win, go for it
+        if finished and self.SOLVENODES and m.Turn==self.player and (deadline is None or time.time() < deadline):
+            solver = PenteSolver(m,self.SOLVENODES,deadline)
+            won,move = solver.Solve()
+            self.nodes += solver.nodes
+            if won:
+                if DEBUG: print "found a forced win at (%d,%d)" % move
+                return move
+
+    # -------------------------------------------------
+        #evaluate votes and decide move: find the best vote and every cell that has it in one go
+        best,options = None,[]
+        for r,c in cells:
+            vote = votes[r*size+c]
+            if best is None or vote>best:
+                best,options = vote,[(r,c)]
+            elif vote==best:
+                options.append((r,c))
+        options.sort()  #cells come in no particular order, so sort them to pick the same way every time
+        return options[self.rng.randint(0,len(options)-1)]
+
+    def Vote(self,m,cells,deadline=None):
+        #add up the votes for each of the cells for ChooseMove.  Returns True if they were all
+        #counted, or False if we ran out of time (or the pattern tables weren't loaded yet)
+        me,you = self.player,1-self.player  #whose move we're choosing, and the opponent
+        size = m.size
+        votes = self.votes
+        # strategy weights (see class definition)
+        A,F,G,H,I,J,K = self.A,self.F,self.G,self.H,self.I,self.J,self.K
+        L,M,N,O,P,Q = self.L,self.M,self.N,self.O,self.P,self.Q
 
         def loc(weight,r,c):
             #print location of recent vote
-            result = " at (%d,%d): weight = %d, for total of %d" % (r,c,weight,self.votes.matrix[r][c])
+            result = " at (%d,%d): weight = %d, for total of %d" % (r,c,weight,votes[r*size+c])
             return result
-        
-        # Clear votes, and don't move onto a space already taken
-        for cell in self.votes:
-            self.votes.matrix[self.votes.row][self.votes.col]=0
-            if m.M.matrix[self.votes.row][self.votes.col]<>0:
-                self.votes.matrix[self.votes.row][self.votes.col] += A
+
+        def late(stage):
+            #check the clock between (and during) each stage of the voting
+            if deadline is not None and time.time() > deadline:
+                if DEBUG: print "out of time, stopped " + stage
+                return True
+            return False
+
+        # everything below goes by the runs on the board, so count them first
+        if late("before counting runs"):
+            return False
+        m.CalcStats()
 
         # move to the end of an opponent's open pair (try to trap)
-        for run in m.Runs[HUMAN][2]:
+        for run in m.Runs[you][2]:
             endlist = m.GetEnds(2,run)
             if len(endlist)==2: #ignore runs that are on the edge of the board
                 oendlist = m.GetOpenEnds(2,run)
                 for pair in oendlist:
 ##                  if len(oendlist)==2:  #open pair - set up a trap
-##                    self.votes.matrix[pair[0]][pair[1]] += B
+##                    votes[pair[0]*size+pair[1]] += B
 ##                    if DEBUG: print "found end of opponent's open pair"
                   if len(oendlist)==1:  #closed pair - spring the trap!
-                    self.votes.matrix[pair[0]][pair[1]] += Q
+                    votes[pair[0]*size+pair[1]] += Q
                     if DEBUG: print "found chance to capture opponent" + loc(Q,pair[0],pair[1])
 
 ##        # move to cap an open three (block a win)
@@ -624,192 +1412,686 @@ class PenteAI:
 ##            endlist = m.GetOpenEnds(3,run)
 ##            if len(endlist)==2: #ignore pairs at edge of board
 ##              for pair in endlist:
-##                  self.votes.matrix[pair[0]][pair[1]] += C
+##                  votes[pair[0]*size+pair[1]] += C
 ##                  if DEBUG: print "found opponent's open three"
 ##
 ##        # move to cap a one-ended three (keep it from growing)
 ##        for run in m.Runs[HUMAN][3]:
 ##            endlist = m.GetOpenEnds(3,run)
 ##            if len(endlist)==1: #focus on runs with only one open end
-##                self.votes.matrix[endlist[0][0]][endlist[0][1]] += D
+##                votes[endlist[0][0]*size+endlist[0][1]] += D
 ##                if DEBUG: print "found one-ended open three"
 ##
 ##        # move to cap any run of four (try to block a win)
 ##        for run in m.Runs[HUMAN][4]:
 ##            endlist = m.GetEnds(4,run)
 ##            for pair in endlist:
-##                 self.votes.matrix[pair[0]][pair[1]] += E
+##                 votes[pair[0]*size+pair[1]] += E
 ##                 if DEBUG: print "found a run of four"
 
         # move to all edge locations (not good for building runs)
-        for c in range(m.size):
-            self.votes.matrix[c][0] += -1
-            self.votes.matrix[c][m.size-1] += F
-        for r in range(m.size):
-            self.votes.matrix[0][r] += -1
-            self.votes.matrix[m.size-1][r] += F
-
-        # move to add an intersection (building complexity and multiple runs)
-        for r in range(m.size-1):
-            for c in range(m.size-1):
-                if m.M.matrix[r][c]==0:
-                    n=0  
-                    #count how many of our pieces are in neighboring cells
-                    for ri in range(r-1,r+2):
-                        for ci in range(c-1,c+2):
-                            if m.M.matrix[ri][ci]==COMPUTER+1:
-                                n += 1
-                    self.votes.matrix[r][c] += (G*n)
-                    #if DEBUG: print "Added %d for my intersections" % (G+n)
-
-        # move to add an intersection (defense against opponent building complexity)
-        for r in range(m.size-1):
-            for c in range(m.size-1):
-                if m.M.matrix[r][c]==0:
-                    n=0  
-                    #count how many of our pieces are in neighboring cells
-                    for ri in range(r-1,r+2):
-                        for ci in range(c-1,c+2):
-                            if m.M.matrix[ri][ci]==HUMAN+1:
-                                n += 1
-                    self.votes.matrix[r][c] += (H*n)
-                    #if DEBUG: print "Added %d for opponent intersections" % (G+n)
-                    
-        # move to make various runs in a row (closed and open)
-        closedthrees = self.ClosedRuns(m,m.Runs[COMPUTER],COMPUTER,3)
-        openthrees = self.OpenRuns(m,m.Runs[COMPUTER],COMPUTER,3)
-        fours = len(m.Runs[COMPUTER][4])  #get current number of runs of four
-        openfours = self.OpenRuns(m,m.Runs[COMPUTER],COMPUTER,4)
-        fives = len(m.Runs[COMPUTER][5])  #get current number of runs of five
-        for c in range(m.size):
-            for r in range(m.size):
-                if m.M.matrix[r][c]==0:
-                    m.M.matrix[r][c]= COMPUTER+1
-                    m.CalcStats()
-                    if len(m.Runs[COMPUTER][3])>closedthrees:
-                        self.votes.matrix[r][c] += I
-                        if DEBUG: print "found chance to make a threesome" + loc(I,r,c)
-                        if self.OpenRuns(m,m.Runs[COMPUTER],COMPUTER,3) > openthrees:
-                            self.votes.matrix[r][c] += J
-                            if DEBUG: print "Found chance to make an OPEN three" + loc(J,r,c)
-                    if len(m.Runs[COMPUTER][4])>fours:
-                        self.votes.matrix[r][c] += K
-                        if DEBUG: print "found chance to make a foursome" + loc(K,r,c)
-                        if self.OpenRuns(m,m.Runs[COMPUTER],COMPUTER,4) > openfours:
-                            self.votes.matrix[r][c] += L
-                            if DEBUG: print "found chance to make an OPEN foursome" + loc(L,r,c)
-                    if len(m.Runs[COMPUTER][5])>fives:
-                        self.votes.matrix[r][c] += M
-                        if DEBUG: print "found a chance to make a five-some" + loc(M,r,c)
-                    m.M.matrix[r][c]=0 #undo our move
-
-        # move to fill in a gap in various runs of opponent pieces
-        m.CalcStats()
-        openthrees = self.OpenRuns(m,m.Runs[HUMAN],HUMAN,3)
-        fours = len(m.Runs[COMPUTER][4])  #get current number of runs of four
-        openfours = self.OpenRuns(m,m.Runs[HUMAN],HUMAN,4)
-        for c in range(m.size):
-            for r in range(m.size):
-                if m.M.matrix[r][c]==0:
-                    m.M.matrix[r][c]= HUMAN+1
-                    m.CalcStats()
-                    if len(m.Runs[HUMAN][5])>0:
-                        self.votes.matrix[r][c] += O
-                        if DEBUG: print "Found chance to block a five-run" + loc(O,r,c)
-                    if len(m.Runs[HUMAN][4])>fours:
-                        if self.OpenRuns(m,m.Runs[HUMAN],HUMAN,4) > openfours:
-                            self.votes.matrix[r][c] += N
-                            if DEBUG: print "found a chance to block an oppponents open-four opportunity" + loc(N,r,c)
-                    if self.OpenRuns(m,m.Runs[HUMAN],HUMAN,3) > openthrees:
-                        self.votes.matrix[r][c] += P
-                        if DEBUG: print "Found chance to block open three opportunity" + loc(P,r,c)
-                    m.M.matrix[r][c]=0 #undo our move
+        for c in range(size):
+            votes[c*size] += -1
+            votes[c*size+size-1] += F
+        for r in range(size):
+            votes[r] += -1
+            votes[(size-1)*size+r] += F
 
+        # move to add an intersection (building complexity and multiple runs), and to add an
+        # intersection of the opponent's (defense against them building complexity)
+        for r,c in cells:
+            if late("looking for intersections"):
+                return False
+            if r<m.size-1 and c<m.size-1:
+                n=o=0
+                #count how many of our pieces, and theirs, are in neighboring cells (on the board)
+                for ri in range(max(0,r-1),r+2):
+                    for ci in range(max(0,c-1),c+2):
+                        cell = m.M[ri,ci]
+                        if cell==me+1:
+                            n += 1
+                        elif cell==you+1:
+                            o += 1
+                votes[r*size+c] += (G*n)+(H*o)
+                #if DEBUG: print "Added %d for my intersections" % (G+n)
 
-    # -------------------------------------------------
-        #evaluate votes and decide move
-        options = m.PickCells(self.votes,max(self.votes))
-        rm,cm = options[randint(0,len(options)-1)]
-        m.TakeTurn(rm,cm)
+        # move to make various runs in a row (closed and open), or to fill in a gap in various
+        # runs of opponent pieces.  Rather than trying a piece on each cell and counting all the
+        # runs again, look up what the piece does to each of the four lines through the cell
+        if deadline is None:
+            values = Patterns(m.rules)[0]
+        else:
+            tables = PreloadPatterns(m.rules)  #don't wait for them if they aren't loaded
+            if tables is None:
+                if DEBUG: print "pattern tables aren't loaded yet, not looking for runs"
+                return False
+            values = tables[0]
+        if late("before counting open runs"):
+            return False
+        threes = len(m.Runs[me][3])
+        closedthrees = self.ClosedRuns(m,m.Runs[me],me,3)
+        openthrees = self.OpenRuns(m,m.Runs[me],me,3)
+        fours = len(m.Runs[me][4])  #get current number of runs of four
+        openfours = self.OpenRuns(m,m.Runs[me],me,4)
+        fives = len(m.Runs[me][5])  #get current number of runs of five
+        theirfours = len(m.Runs[you][4])
+        theirfives = len(m.Runs[you][5])
+        theiropenthrees = self.OpenRuns(m,m.Runs[you],you,3)
+        theiropenfours = self.OpenRuns(m,m.Runs[you],you,4)
+        if late("before looking for runs"):
+            return False
+        for r,c in cells:
+            if late("looking for runs"):
+                return False
+            mine = yours = 0
+            for dr,dc in DIRECTIONS:
+                key = m.LineKey(r,c,dr,dc)
+                mine += values[PlayerKey(key,me)]
+                yours += values[PlayerKey(key,you)]
+            self.nodes += 2
+            if threes+PatternField(mine,PF_THREES)>closedthrees:
+                votes[r*size+c] += I
+                if DEBUG: print "found chance to make a threesome" + loc(I,r,c)
+                if PatternField(mine,PF_OPENTHREES) > 0:
+                    votes[r*size+c] += J
+                    if DEBUG: print "Found chance to make an OPEN three" + loc(J,r,c)
+            if PatternField(mine,PF_FOURS) > 0:
+                votes[r*size+c] += K
+                if DEBUG: print "found chance to make a foursome" + loc(K,r,c)
+                if PatternField(mine,PF_OPENFOURS) > 0:
+                    votes[r*size+c] += L
+                    if DEBUG: print "found chance to make an OPEN foursome" + loc(L,r,c)
+            if PatternField(mine,PF_FIVES) > 0:
+                votes[r*size+c] += M
+                if DEBUG: print "found a chance to make a five-some" + loc(M,r,c)
+
+            if theirfives+PatternField(yours,PF_FIVES) > 0:
+                votes[r*size+c] += O
+                if DEBUG: print "Found chance to block a five-run" + loc(O,r,c)
+            if theirfours+PatternField(yours,PF_FOURS) > fours:
+                if PatternField(yours,PF_OPENFOURS) > 0:
+                    votes[r*size+c] += N
+                    if DEBUG: print "found a chance to block an oppponents open-four opportunity" + loc(N,r,c)
+            if PatternField(yours,PF_OPENTHREES) > 0:
+                votes[r*size+c] += P
+                if DEBUG: print "Found chance to block open three opportunity" + loc(P,r,c)
+        return True
+
+def ReadWeights(filename=CONFIGFILE):
+    #returns a dictionary of PenteAI weights from the [Weights] section of a config file, e.g.
+    #   [Weights]
+    #   j = 12.5
+    #Weights that aren't in the file (or a missing file) keep the values in PenteAI
+    cp = ConfigParser.ConfigParser()
+    cp.read(filename)
+    weights = {}
+    if cp.has_section("Weights"):
+        for name,value in cp.items("Weights"):
+            value = float(value)
+            if value==int(value):
+                value = int(value)
+            weights[name.upper()] = value
+    return weights
+
+def ReadSolveNodes(filename=CONFIGFILE):
+    #returns PenteAI.SOLVENODES from the [Solver] section of a config file, e.g.
+    #   [Solver]
+    #   nodes = 200
+    #or the value in PenteAI if it isn't there
+    cp = ConfigParser.ConfigParser()
+    cp.read(filename)
+    if cp.has_option("Solver","nodes"):
+        return cp.getint("Solver","nodes")
+    return PenteAI.SOLVENODES
+
+class PenteSolver:
+    """Tries to prove that the player to move in model m can force a win, by five in a row or by
+    making enough captures, using depth-first proof-number search (df-pn).  Every position gets
+    a proof number (roughly, how many more positions would have to be looked at to prove a win for
+    the player to move there) and a disproof number (the same, to prove they can't win), which are
+    kept in a transposition table keyed by position, so positions reached by different orders of
+    moves are only worked on once.  The search always follows the move that looks closest to being
+    settled, until the root is proved or disproved, or maxnodes positions have been looked at.
+    Only moves within RADIUS cells of a piece already on the board are considered; when the
+    opponent threatens to win on the next move, only moves that block the threat or make a capture.
+    Works on its own copy of the model, and plays by its rules."""
+    INFINITY = 100000000
+    RADIUS = 2
+    def __init__(self,m,maxnodes=10000,deadline=None):
+        self.model = m.Clone()
+        self.player = m.Turn  #the player trying to win
+        self.maxnodes = maxnodes
+        self.deadline = deadline  #time.time() to give up at, if any
+        self.nodes = 0      #number of positions looked at so far
+        self.table = {}     #transposition table: position key:(proof number,disproof number)
+        self.undo = []      #moves played by Play(), with the pieces they captured
+        # Zobrist hashing: each piece on each cell, and whose turn it is, has a random 64-bit
+        # number, and a position's hash is all the numbers for it xor'd together
+        rng = Random(m.size)
+        self.zobrist = [[rng.getrandbits(64) for i in range(m.size*m.size)] for p in range(2)]
+        self.zturn = rng.getrandbits(64)
+        self.hash = 0
+        for row,col,v in self.model.M.Pieces():
+            self.hash ^= self.zobrist[v-1][row*m.size+col]
+        if self.model.Turn:
+            self.hash ^= self.zturn
+
+    def Solve(self):
+        #returns (True,(row,col)) with the winning move if the player to move can force a win,
+        #(False,None) if they can't, or (None,None) if we ran out of nodes (or time) before finding out
+        self.MID(self.INFINITY,self.INFINITY)
+        phi,delta = self.table.get(self.Key(),(1,1))
+        if phi==0:
+            return True,self.WinningMove()
+        if delta==0:
+            return False,None
+        return None,None
+
+    def Key(self):
+        #the transposition table key for the current position.  Under the tournament opening rule
+        #the same pieces can allow different moves depending on how many moves have been made, up
+        #to the first player's second move
+        m = self.model
+        if m.rules.tournament:
+            return self.hash,m.Captures[0],m.Captures[1],min(m.movecount,3)
+        return self.hash,m.Captures[0],m.Captures[1]
+
+    def Play(self,move):
+        #make a move for the player whose turn it is, capturing anything it sandwiches
+        m = self.model
+        p = m.Turn
+        row,col = move
+        m.SetCell(row,col,p+1)
+        self.hash ^= self.zobrist[p][row*m.size+col]
+        captured,value = [],0
+        for dr,dc in DIRECTIONS:
+            for dr,dc in (dr,dc),(-dr,-dc):
+                for n in m.rules.captures:
+                    r,c = row+(n+1)*dr,col+(n+1)*dc
+                    if 0<=r<m.size and 0<=c<m.size and m.M[r,c]==p+1:
+                        cells = [(row+i*dr,col+i*dc) for i in range(1,n+1)]
+                        if [m.M[cell] for cell in cells]==[2-p]*n:
+                            captured.extend(cells)
+                            value += m.rules.CaptureValue(n)
+        for r,c in captured:
+            m.SetCell(r,c,0)
+            self.hash ^= self.zobrist[1-p][r*m.size+c]
+        m.Captures[p] += value
+        m.Turn = 1-p
+        m.movecount += 1
+        self.hash ^= self.zturn
+        self.undo.append((move,captured,value))
+
+    def Undo(self):
+        #take back the last move made by Play()
+        m = self.model
+        (row,col),captured,value = self.undo.pop()
+        m.Turn = p = 1-m.Turn
+        m.movecount -= 1
+        self.hash ^= self.zturn
+        m.Captures[p] -= value
+        for r,c in captured:
+            m.SetCell(r,c,2-p)
+            self.hash ^= self.zobrist[1-p][r*m.size+c]
+        m.SetCell(row,col,0)
+        self.hash ^= self.zobrist[p][row*m.size+col]
+
+    def Moves(self):
+        #returns (won,moves) for the player to move: won is True if any of the moves wins straight
+        #away, in which case moves just holds that move
+        m = self.model
+        p = m.Turn
+        values,flags = Patterns(m.rules)
+        cells = {}
+        for row,col,v in m.M.Pieces():
+            for r in range(max(0,row-self.RADIUS),min(m.size,row+self.RADIUS+1)):
+                for c in range(max(0,col-self.RADIUS),min(m.size,col+self.RADIUS+1)):
+                    cells[r,c] = True
+        if not cells:
+            return False,[(m.size/2,m.size/2)]  #empty board, start in the middle
+        moves,blocks,captures = [],[],[]
+        for cell in sorted(cells):
+            if not m.Legal(cell[0],cell[1]):
+                continue
+            keys = [m.LineKey(cell[0],cell[1],dr,dc) for dr,dc in DIRECTIONS]
+            wins = []
+            for q in p,1-p:
+                total = five = 0
+                for key in keys:
+                    key = PlayerKey(key,q)
+                    total += values[key]
+                    five |= flags[key] & FIVE
+                wins.append(five or (m.MAXCAPTURES is not None and
+                                     m.Captures[q]+PatternField(total,PF_CAPTURES) >= m.MAXCAPTURES))
+                if q==p and PatternField(total,PF_CAPTURES):
+                    captures.append(cell)
+            if wins[0]:
+                return True,[cell]
+            if wins[1]:
+                blocks.append(cell)
+            moves.append(cell)
+        if blocks:
+            #the opponent wins next move unless we take their winning cell(s) or capture something
+            return False,blocks+[cell for cell in captures if not cell in blocks]
+        return False,moves
+
+    def MID(self,thphi,thdelta):
+        #work on the current position until its proof number reaches thphi or its disproof
+        #number reaches thdelta (or we run out of nodes or time), and store the results in the table
+        INFINITY = self.INFINITY
+        key = self.Key()
+        if self.OutOfTime():
+            return
+        self.nodes += 1
+        won,moves = self.Moves()
+        if won:
+            self.table[key] = 0,INFINITY
+            return
+        if not moves:
+            #board's full, it's a draw, which counts as a loss for the player trying to win
+            if self.model.Turn==self.player:
+                self.table[key] = INFINITY,0
+            else:
+                self.table[key] = 0,INFINITY
+            return
+        children = []
+        for move in moves:
+            self.Play(move)
+            children.append((move,self.Key()))
+            self.Undo()
+        while True:
+            #our proof number is the smallest disproof number of our children, and our disproof
+            #number is the sum of their proof numbers
+            best,phisum,delta1,delta2 = None,0,INFINITY,INFINITY
+            for move,childkey in children:
+                phi,delta = self.table.get(childkey,(1,1))
+                phisum = min(INFINITY,phisum+phi)
+                if best is None or delta<delta1:
+                    best,bestphi,delta1,delta2 = move,phi,delta,delta1
+                elif delta<delta2:
+                    delta2 = delta
+            if delta1>=thphi or phisum>=thdelta or self.nodes>=self.maxnodes or self.OutOfTime():
+                break
+            self.Play(best)
+            self.MID(min(INFINITY,thdelta+bestphi-phisum),min(thphi,delta2+1))
+            self.Undo()
+        self.table[key] = delta1,phisum
+
+    def OutOfTime(self):
+        return self.deadline is not None and time.time() > self.deadline
+
+    def WinningMove(self):
+        #returns the move that wins from the current position, which has been proved to be a win
+        won,moves = self.Moves()
+        for move in moves:
+            self.Play(move)
+            phi,delta = self.table.get(self.Key(),(1,1))
+            self.Undo()
+            if won or delta==0:
+                return move
+
+# -------------------------------------------------------
+# Batched evaluation
+# These functions compute the same statistics as PenteModel.CalcStats and the same
+# vote matrix as PenteAI.MakeMove, but for a whole stack of positions at once using numpy
+# arrays, so training data can be generated without looping over PenteModel objects.
+# Positions are stored the same way as PenteModel.M: 0=empty, p+1=piece of player p
+
+def _Shift(a,dr,dc,fill):
+    #returns array b, with b[...,r,c] = a[...,r+dr,c+dc], or fill if that is off the board
+    b = numpy.empty_like(a)
+    b[...] = fill
+    size = a.shape[-1]
+    if abs(dr)>=size or abs(dc)>=size:
+        return b
+    b[...,max(0,-dr):size-max(0,dr),max(0,-dc):size-max(0,dc)] = \
+        a[...,max(0,dr):size-max(0,-dr),max(0,dc):size-max(0,-dc)]
+    return b
+
+def _RunLengths(X,E,dr,dc):
+    #for each cell, returns the length of the run of X starting there and heading in direction dr,dc,
+    #and whether the cell just past the end of that run is empty (E)
+    R = X.astype(numpy.int32)
+    O = E.copy()
+    for i in range(X.shape[-1]):
+        R = X * (1 + _Shift(R,dr,dc,0))
+        O = numpy.where(X,_Shift(O,dr,dc,False),E)
+    return R,O
+
+class _RunStats:
+    #run statistics for one player over a stack of positions, in each of the four DIRECTIONS
+    def __init__(self,X,E):
+        self.X = X
+        self.lines = []
+        for dr,dc in DIRECTIONS:
+            Rf,Of = _RunLengths(X,E,dr,dc)     #runs heading forward from each cell
+            Rb,Ob = _RunLengths(X,E,-dr,-dc)   #runs heading backward from each cell
+            start = X & ~_Shift(X,-dr,-dc,False)  #first cell of each run
+            self.lines.append((dr,dc,Rf,Of,Rb,Ob,start,_Shift(E,-dr,-dc,False)))
+
+    def Count(self,n):
+        #number of runs of length n in each position, counted the way CountRuns does it
+        total = 0
+        if n==1:
+            #single pieces that aren't part of any larger run
+            single = self.X.copy()
+            for dr,dc in DIRECTIONS:
+                single &= ~_Shift(self.X,dr,dc,False) & ~_Shift(self.X,-dr,-dc,False)
+            return single.sum(axis=(-2,-1))
+        for dr,dc,Rf,Of,Rb,Ob,start,Eprev in self.lines:
+            if n==MAXRUN:
+                total = total + (Rf>=n).sum(axis=(-2,-1))  #every window of MAXRUN counts
+            else:
+                total = total + (start & (Rf==n)).sum(axis=(-2,-1))
+        return total
+
+    def OpenRuns(self,n):
+        #number of runs of length n with empty cells on both ends (see PenteAI.OpenRuns)
+        total = 0
+        for dr,dc,Rf,Of,Rb,Ob,start,Eprev in self.lines:
+            total = total + (start & (Rf==n) & Eprev & Of).sum(axis=(-2,-1))
+        return total
+
+    def ClosedRuns(self,n):
+        #number of runs of length n with at least one end on the board, but not both ends empty
+        #(see PenteAI.ClosedRuns)
+        total = 0
+        ones = numpy.ones(self.X.shape,bool)
+        for dr,dc,Rf,Of,Rb,Ob,start,Eprev in self.lines:
+            onboard = _Shift(ones,-dr,-dc,False) | _Shift(ones,n*dr,n*dc,False)
+            total = total + (start & (Rf==n) & ~(Eprev & Of) & onboard).sum(axis=(-2,-1))
+        return total
+
+    def MoveDeltas(self):
+        #for every cell, the change in run counts if a piece were placed there.  Returns a
+        #dictionary of arrays: (n,False) for runs of length n, (n,True) for open runs of length n
+        deltas = {}
+        for n in range(3,MAXRUN+1):
+            deltas[n,False] = 0
+            deltas[n,True] = 0
+        for dr,dc,Rf,Of,Rb,Ob,start,Eprev in self.lines:
+            a = _Shift(Rb,-dr,-dc,0)        #length of run joined from behind
+            b = _Shift(Rf,dr,dc,0)          #length of run joined from ahead
+            oa = _Shift(Ob,-dr,-dc,False)   #is the far end behind open?
+            ob = _Shift(Of,dr,dc,False)     #is the far end ahead open?
+            L = a+b+1                       #length of the combined run
+            for n in range(3,MAXRUN):
+                deltas[n,False] = deltas[n,False] + (L==n).astype(int) - (a==n) - (b==n)
+                deltas[n,True] = deltas[n,True] + (oa&ob&(L==n)).astype(int) - (oa&(a==n)) - (ob&(b==n))
+            def windows(x):
+                return numpy.maximum(x-MAXRUN+1,0)
+            deltas[MAXRUN,False] = deltas[MAXRUN,False] + windows(L) - windows(a) - windows(b)
+        return deltas
+
+def BatchFeatures(boards,captures):
+    #work out the parts of the PenteAI vote matrix for a stack of positions, one for each weight,
+    #so the votes for any set of weights can be added up from them
+    #   boards   : (N,size,size) int8 array of positions, 0=empty, p+1=piece of player p
+    #   captures : (N,2) array of capture counts for each player
+    #returns runs,features,base,winners:
+    #   runs     : (N,2,MAXRUN+1) array, runs[i][p][n] = len(model.Runs[p][n]) after CalcStats
+    #   features : dictionary of weight name:(N,size,size) array, how many times each weight is
+    #              added to each cell's votes for the computer to move
+    #   base     : (N,size,size) array, the votes that don't depend on any weight
+    #   winners  : (N,) array, model.Winner after gameWon, or -1 if nobody has won
+    if numpy is None:
+        raise ImportError("BatchFeatures requires numpy")
+    boards = numpy.asarray(boards,numpy.int8)
+    captures = numpy.asarray(captures)
+    count,size = boards.shape[0],boards.shape[-1]
+    E = boards==0
+    stats = [_RunStats(boards==p+1,E) for p in range(2)]
+
+    runs = numpy.zeros((count,2,MAXRUN+1),numpy.int32)
+    for p in range(2):
+        for n in range(1,MAXRUN+1):
+            runs[:,p,n] = stats[p].Count(n)
+    winners = -numpy.ones(count,numpy.int8)
+    for p in range(2):
+        winners[(runs[:,p,MAXRUN]>0) | (captures[:,p]==MAXCAPTURES)] = p
+
+    me,you = stats[COMPUTER],stats[HUMAN]
+    def per(x):
+        #broadcast a per-position count over the board
+        return numpy.asarray(x).reshape(-1,1,1)
+    features = {}
+    # don't move onto a space already taken
+    features['A'] = ~E
+    # move to the end of an opponent's closed pair (capture)
+    features['Q'] = 0
+    for dr,dc in DIRECTIONS:
+        for k in (1,-1):
+            trap = _Shift(you.X,k*dr,k*dc,False) & _Shift(you.X,2*k*dr,2*k*dc,False) & \
+                   _Shift(me.X,3*k*dr,3*k*dc,False)
+            features['Q'] = features['Q'] + (E & trap)
+    # move to all edge locations
+    base = numpy.zeros(boards.shape,numpy.int32)
+    base[:,:,0] += -1
+    base[:,0,:] += -1
+    features['F'] = numpy.zeros(boards.shape,numpy.int32)
+    features['F'][:,:,size-1] += 1
+    features['F'][:,size-1,:] += 1
+    # move to add an intersection, or block an opponent's intersection
+    inner = numpy.zeros(boards.shape,bool)
+    inner[:,:size-1,:size-1] = True
+    for X,weight in ((me.X,'G'),(you.X,'H')):
+        n = 0
+        for dr in (-1,0,1):
+            for dc in (-1,0,1):
+                n = n + _Shift(X,dr,dc,False)
+        features[weight] = n * (E & inner)
+    # move to make various runs in a row (closed and open)
+    d = me.MoveDeltas()
+    threes,closedthrees,openthrees = me.Count(3),me.ClosedRuns(3),me.OpenRuns(3)
+    fours,openfours,fives = me.Count(4),me.OpenRuns(4),me.Count(5)
+    three = per(threes)+d[3,False] > per(closedthrees)
+    features['I'] = E & three
+    features['J'] = E & three & (per(openthrees)+d[3,True] > per(openthrees))
+    four = per(fours)+d[4,False] > per(fours)
+    features['K'] = E & four
+    features['L'] = E & four & (per(openfours)+d[4,True] > per(openfours))
+    features['M'] = E & (per(fives)+d[5,False] > per(fives))
+    # move to fill in a gap in various runs of opponent pieces
+    d = you.MoveDeltas()
+    openthrees,openfours,fives = you.OpenRuns(3),you.OpenRuns(4),you.Count(5)
+    features['O'] = E & (per(fives)+d[5,False] > 0)
+    four = per(you.Count(4))+d[4,False] > per(fours)
+    features['N'] = E & four & (per(openfours)+d[4,True] > per(openfours))
+    features['P'] = E & (per(openthrees)+d[3,True] > per(openthrees))
+    for name in features:
+        features[name] = numpy.asarray(features[name],numpy.int32)
+    return runs,features,base,winners
+
+def BatchEvaluate(boards,captures,weights=None):
+    #evaluate a stack of positions at once
+    #   boards   : (N,size,size) int8 array of positions, 0=empty, p+1=piece of player p
+    #   captures : (N,2) array of capture counts for each player
+    #   weights  : dictionary of PenteAI weights to use instead of the usual ones, if any
+    #returns runs,votes,winners:
+    #   runs     : (N,2,MAXRUN+1) array, runs[i][p][n] = len(model.Runs[p][n]) after CalcStats
+    #   votes    : (N,size,size) array, the PenteAI vote matrix for the computer to move
+    #   winners  : (N,) array, model.Winner after gameWon, or -1 if nobody has won
+    if numpy is None:
+        raise ImportError("BatchEvaluate requires numpy")
+    runs,features,votes,winners = BatchFeatures(boards,captures)
+    for name in PenteAI.WEIGHTS:
+        if weights and name in weights:
+            votes = votes + weights[name]*features[name]
+        else:
+            votes = votes + getattr(PenteAI,name)*features[name]
+    return runs,votes,winners
+
+# -------------------------------------------------------
+# Shared board pool
+# Positions to be analyzed by several worker processes can be kept in shared memory instead of
+# being pickled and sent to each worker.  Create the pool before starting the workers (pass it to
+# multiprocessing.Process, or let them inherit it), then each side reads and writes positions by
+# number with Load and Store, or looks at all of them at once through numpy arrays.
+
+class BoardPool:
+    """A block of shared memory holding count positions on size x size boards, as fixed-size records
+    of bytes.  Each record is HEADER bytes (whose turn it is, the winner or -1, the captures for each
+    player, and the row and col of the last move) followed by the board, row by row, stored the same
+    way as PenteModel.M: 0=empty, p+1=piece of player p.  Boards can be up to 127 cells across."""
+    HEADER = 6
+    def __init__(self,count,size):
+        if size > 127:
+            raise ValueError("BoardPool boards can be at most 127 cells across")
+        self.count = count
+        self.size = size
+        self.recordsize = self.HEADER+size*size
+        self.buffer = sharedctypes.RawArray('b',count*self.recordsize)  #starts out all zeros
+
+    def Store(self,i,m):
+        #copy the position in model m into record i
+        record = [0]*self.recordsize
+        record[0] = m.Turn
+        if m.Winner is None:
+            record[1] = -1
+        else:
+            record[1] = m.Winner
+        record[2:4] = m.Captures
+        record[4:6] = m.lastmove
+        for row,col,v in m.M.Pieces():
+            record[self.HEADER+row*self.size+col] = v
+        start = i*self.recordsize
+        self.buffer[start:start+self.recordsize] = record
+
+    def Load(self,i,m=None):
+        #returns a PenteModel holding the position in record i.  Pass a model of the right size as m
+        #to reuse it instead of making a new one (or to use rules other than the standard ones);
+        #its listeners aren't told about the change
+        if m is None:
+            m = PenteModel(self.size)
+        start = i*self.recordsize
+        record = self.buffer[start:start+self.recordsize]
+        m.Turn = record[0]
+        if record[1] < 0:
+            m.Winner = None
+        else:
+            m.Winner = record[1]
+        m.Captures = record[2:4]
+        m.lastmove = tuple(record[4:6])
+        m.M.Clear()
+        for j in range(self.size*self.size):
+            if record[self.HEADER+j]:
+                m.M[divmod(j,self.size)] = record[self.HEADER+j]
+        m.CalcLines()
         m.CalcStats()
-        
-        
+        #every piece that's been played is either still on the board or has been captured
+        m.movecount = len(list(m.M.Pieces()))+m.rules.Pieces(m.Captures[0])+m.rules.Pieces(m.Captures[1])
+        return m
+
+    def Boards(self):
+        #returns a (count,size,size) int8 numpy array of all the boards, sharing memory with the pool,
+        #e.g. to pass to BatchEvaluate without copying anything
+        if numpy is None:
+            raise ImportError("BoardPool.Boards requires numpy")
+        return numpy.ndarray((self.count,self.size,self.size),numpy.int8,self.buffer,self.HEADER,
+                             (self.recordsize,self.size,1))
+
+    def Captures(self):
+        #returns a (count,2) int8 numpy array of the captures for each player, sharing memory with the pool
+        if numpy is None:
+            raise ImportError("BoardPool.Captures requires numpy")
+        return numpy.ndarray((self.count,2),numpy.int8,self.buffer,2,(self.recordsize,1))
+
 # -------------------------------------------------------
 # Beginning of Main Loop
 # Define Constants
+if __name__ == "__main__":
+
+    # create a model instance; the board size and rules can be given on the command line,
+    # e.g. "pente.py 19 tournament" for a standard tournament board and rules
+    size = SIZE
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+    rules = STANDARD
+    if len(sys.argv) > 2:
+        rules = RULES[sys.argv[2].lower()]
+    model = PenteModel(size,rules=rules)
+    # load (or work out) the pattern tables the computer needs in the background, rather than
+    # making the first click wait for them
+    PreloadPatterns(rules)
+    # create a view instance
+    view = PenteView(model,BOARDSIZE)
+    # create an AI instance
+    ai = PenteAI(model,ReadWeights())  #weights can be changed in pente.cfg, e.g. by tune.py
+    ai.SOLVENODES = ReadSolveNodes()   #so can the forced win search
+    # play sound effects when pieces are placed or captured
+    def PlaceSound(row,col,p):
+        sounds.Play(("P1click","P2click")[p])
+    def CaptureSound(p,cells):
+        if p == COMPUTER:
+            sounds.Play("laugh")
+        else:
+            sounds.Play("ohhh")
+    model.on_place.append(PlaceSound)
+    model.on_capture.append(CaptureSound)
 
-# create a model instance
-model = PenteModel(SIZE)
-# create a view instance
-view = PenteView(model,BOARDSIZE)
-# create an AI instance
-ai = PenteAI(model)
-
-# --------------------------------------------------------------------
-# initialize pygame and our window
-pygame.init()
-P1click = pygame.mixer.Sound("QABITEM.WAV")
-P2click = pygame.mixer.Sound("Windows XP Balloon.wav")
-laugh = pygame.mixer.Sound("giddylaugh.wav")
-ohhh = pygame.mixer.Sound("ohhh.wav")
-
-#debug
-##model.M.matrix[0][0]=2
-##model.M.matrix[3][4]=2
-##model.M.matrix[4][3]=2
-##model.wins[0] = 12
-##model.wins[1] = 17
-##model.Captures=[4,4]
-#view.ReDraw(view.board)
-
-# main event loop
-running = 1
-done = 0
-
-while not done:
-  while (running == 1):
-    for event in pygame.event.get():
+    # --------------------------------------------------------------------
+    # initialize pygame and our window
+    pygame.init()
+
+    #debug
+    ##model.M.matrix[0][0]=2
+    ##model.M.matrix[3][4]=2
+    ##model.M.matrix[4][3]=2
+    ##model.wins[0] = 12
+    ##model.wins[1] = 17
+    ##model.Captures=[4,4]
+    #view.ReDraw(view.board)
+
+    # main event loop
+    # only wake up for the events we handle, not for every mouse movement
+    pygame.event.set_blocked(None)
+    pygame.event.set_allowed([QUIT,MOUSEBUTTONDOWN,VIDEOEXPOSE,AITHINK])
+    clock = pygame.time.Clock()
+    view.ReDraw(view.board)
+    view.showBoard (view.ttt, view.board, model.Turn, model.Winner)
+    done = 0
+
+    while not done:
+        # sleep until something happens, instead of polling for events
+        event = pygame.event.wait()
         if event.type is QUIT:
-            running = 0  #stop event loop
             done = 1     #stop program
+        elif event.type is VIDEOEXPOSE:
+            # the window was uncovered; copy the whole board back onto it
+            view.dirty.append(view.board.get_rect())
+        elif event.type is AITHINK:
+            # see if the computer has decided on its move yet
+            move = ai.PollMove()
+            if move:
+                pygame.time.set_timer(AITHINK,0)  #stop checking
+                model.TakeTurn(move[0],move[1])
+                # check for a winner
+                model.gameWon()
+                # re-draw the board
+                view.ReDraw(view.board)
         elif event.type is MOUSEBUTTONDOWN:
-            # the user clicked; place a piece
-            view.clickBoard()
+            if model.Turn==COMPUTER and model.Winner==None:
+                pass  #wait for the computer to finish its move
+            elif model.Winner==None:
+                # the user clicked; place a piece
+                view.clickBoard()
+            else:
+                # the user clicked; start a new game
+                model.wins[(model.Turn+1)%2] += 1  #increment the win counter
+                model.Reset()  #reset game state
+            # check for a winner
+            model.gameWon()
             # refresh the board
             view.ReDraw(view.board)
-            # play click sound
-            P1click.play()
-            # log statistics
-            model.CalcStats()
-        # check for a winner
-        model.gameWon()
-
-        # update the display
-        view.showBoard (view.ttt, view.board, model.Turn, model.Winner)
-
-        # Check for a winner
-        if model.Winner<>None:
-            view.ReDraw(view.board)
-            view.showBoard(view.ttt, view.board, model.Turn, model.Winner)
-            running = 0; #stop event loop
 
-        # Let the computer take a turn
-        if model.Turn == COMPUTER and model.Winner==None:
-            ai.MakeMove()
-            # re-draw the board
-            view.ReDraw(view.board)
-            # play click sound
-            P2click.play()
+        # Let the computer take a turn; it thinks in the background, and we check on it
+        # with AITHINK timer events
+        if model.Turn == COMPUTER and model.Winner==None and ai.Progress() is None:
+            ai.StartMove()
+            pygame.time.set_timer(AITHINK,1000/FRAMERATE)
 
-  for event in pygame.event.get():
-        if event.type is QUIT:
-            done = 1     #stop program
-        elif event.type is MOUSEBUTTONDOWN:
-            # the user clicked; start a new game
-            model.wins[(model.Turn+1)%2] += 1  #increment the win counter
-            model.Reset()  #reset game state
-            view.ReDraw(view.board)
-            view.showBoard(view.ttt, view.board, model.Turn, model.Winner)
-            running = 1    #start running game again
-            
-            
\ No newline at end of file
+        # update the display, with the computer's progress if it's thinking
+        view.showBoard (view.ttt, view.board, model.Turn, model.Winner, ai.Progress())
+
+        # don't update the display more than FRAMERATE times a second
+        clock.tick(FRAMERATE)
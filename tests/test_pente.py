@@ -0,0 +1,552 @@
+# Tests for pente.py.  Run from the top of the repository with
+#   python -m unittest discover -s tests
+
+import os, sys, time, pickle, shutil, tempfile, threading, StringIO, multiprocessing, unittest
+from array import array
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+import pente
+from pente import *
+
+def RandomModel(size,rng,fill,**kw):
+    #a model with random pieces on it (not necessarily a position a real game could reach)
+    m = PenteModel(size,**kw)
+    for r in range(size):
+        for c in range(size):
+            if rng.random() < fill:
+                m.M[r,c] = 1+(rng.random()<0.5)
+    m.CalcLines()
+    m.CalcStats()
+    return m
+
+def BaselineCounts(M,p):
+    #the number of runs of each length 1-5 of pieces p in Matrix M, counted the way CalcStats did
+    #before BatchEvaluate: Nested() only compared a run with the first longer run, and the
+    #single pieces stopped at the first one
+    runs = [0,[],[],[],[],[]]
+    for n in range(MAXRUN,0,-1):
+        def Nested(run):
+            for ni in range(len(run)+1,MAXRUN+1):
+                for runlist in runs[ni]:
+                    for coord in run:
+                        if not coord in runlist:
+                            return False
+                    return True
+            return False
+        runs[n] = []
+        for cell in M:
+            if n==1 and cell==p:
+                run = [(M.row,M.col)]
+                if not Nested(run):
+                    runs[n].append(run)
+                break
+            for check,dr,dc in (M.CheckRight,0,1),(M.CheckDown,1,0),(M.CheckDiag1,1,1),(M.CheckDiag2,-1,1):
+                if check(n,p):
+                    run = [(M.row+i*dr,M.col+i*dc) for i in range(n)]
+                    if not Nested(run):
+                        runs[n].append(run)
+    return [len(runs[n]) for n in range(1,MAXRUN+1)]
+
+def BaselineVotes(ai,m):
+    #the edge and run votes for each legal cell, worked out the way ChooseMove did before the
+    #pattern tables: by trying a piece on the cell, for each player, and counting all the runs again
+    me,you = ai.player,1-ai.player
+    m.CalcStats()
+    closedthrees = ai.ClosedRuns(m,m.Runs[me],me,3)
+    openthrees = ai.OpenRuns(m,m.Runs[me],me,3)
+    fours = len(m.Runs[me][4])
+    openfours = ai.OpenRuns(m,m.Runs[me],me,4)
+    fives = len(m.Runs[me][5])
+    theiropenthrees = ai.OpenRuns(m,m.Runs[you],you,3)
+    theiropenfours = ai.OpenRuns(m,m.Runs[you],you,4)
+    votes = {}
+    for r,c in m.LegalMoves():
+        vote = -(r==0)-(c==0)+ai.F*((r==m.size-1)+(c==m.size-1))
+        m.SetCell(r,c,me+1)
+        m.CalcStats()
+        if len(m.Runs[me][3])>closedthrees:
+            vote += ai.I
+            if ai.OpenRuns(m,m.Runs[me],me,3) > openthrees:
+                vote += ai.J
+        if len(m.Runs[me][4])>fours:
+            vote += ai.K
+            if ai.OpenRuns(m,m.Runs[me],me,4) > openfours:
+                vote += ai.L
+        if len(m.Runs[me][5])>fives:
+            vote += ai.M
+        m.SetCell(r,c,you+1)
+        m.CalcStats()
+        if len(m.Runs[you][5])>0:
+            vote += ai.O
+        if len(m.Runs[you][4])>fours:
+            if ai.OpenRuns(m,m.Runs[you],you,4) > theiropenfours:
+                vote += ai.N
+        if ai.OpenRuns(m,m.Runs[you],you,3) > theiropenthrees:
+            vote += ai.P
+        m.SetCell(r,c,0)
+        votes[r,c] = vote
+    m.CalcStats()
+    return votes
+
+def Position(rows):
+    #a model with X (player 0) and O (player 1) pieces where the strings say
+    m = PenteModel(len(rows))
+    for r,row in enumerate(rows):
+        for c,ch in enumerate(row):
+            if ch<>'.':
+                m.M[r,c] = 'XO'.index(ch)+1
+    m.CalcLines()
+    m.CalcStats()
+    return m
+
+class RunCountTest(unittest.TestCase):
+    #what CalcStats counts as a run now, compared with what it used to count
+    POSITIONS = [
+        #separate pieces: all of them are runs of one now, only the first one was before
+        (["X..X...",".......","...X...",".......",".......",".......","......X"],
+         [1,0,0,0,0],[4,0,0,0,0]),
+        #two fives: the fours, threes and pairs inside the second one aren't runs of their own now
+        (["XXXXX..",".......","XXXXX..",".......",".......",".......","......."],
+         [1,6,4,2,2],[0,0,0,0,2]),
+        #a row of three and a diagonal of four sharing a corner
+        (["XXX....",".X.....","..X....","...X...",".......",".......","......."],
+         [0,5,1,1,0],[0,2,1,1,0]),
+        #no runs inside other runs, so nothing's changed
+        (["XX.XX..","X......","X......",".......","...OOO.",".......","......."],
+         [0,3,1,0,0],[0,3,1,0,0]),
+    ]
+
+    def testCounts(self):
+        for rows,before,after in self.POSITIONS:
+            m = Position(rows)
+            self.assertEqual(BaselineCounts(m.M,1),before)
+            self.assertEqual([len(runs) for runs in m.Runs[0][1:]],after)
+
+    def testMaximalRuns(self):
+        #every run of 2-4 counted now is as long as it can be: neither end has another of its pieces
+        rng = Random(6)
+        for trial in range(10):
+            m = RandomModel(9,rng,0.5)
+            for p in 0,1:
+                for n in range(2,MAXRUN):
+                    for run in m.Runs[p][n]:
+                        last = run.End()
+                        for r,c in (run.row-run.dr,run.col-run.dc),(last[0]+run.dr,last[1]+run.dc):
+                            self.assertFalse(0<=r<m.size and 0<=c<m.size and m.M[r,c]==p+1)
+
+class BatchTest(unittest.TestCase):
+    def testSameAsChooseMove(self):
+        if numpy is None:
+            return  #BatchEvaluate needs numpy
+        rng = Random(1)
+        for trial in range(30):
+            size = rng.choice([7,9,13])
+            m = RandomModel(size,rng,rng.choice([0.1,0.3,0.5,0.7]))
+            ai = PenteAI(m)
+            ai.SOLVENODES = 0
+            ai.ChooseMove(m)
+            runs,votes,winners = BatchEvaluate(numpy.array(m.M.matrix,numpy.int8)[None],
+                                               numpy.array([m.Captures]))
+            m.CalcStats()
+            self.assertEqual(runs[0].tolist(),[[0]+[len(runs) for runs in m.Runs[p][1:]] for p in range(2)])
+            for r,c in m.LegalMoves():
+                self.assertEqual(votes[0][r][c],ai.votes[r*size+c])
+
+    def testSameAsTrialPlacement(self):
+        #the run votes looked up in the pattern tables are the ones trying a piece on each cell gave
+        rng = Random(6)
+        for trial in range(20):
+            size = rng.choice([7,9,13])
+            m = RandomModel(size,rng,rng.choice([0.1,0.3,0.5]))
+            ai = PenteAI(m,{"G":0,"H":0,"Q":0},player=rng.randint(0,1))  #leave out the other votes
+            ai.SOLVENODES = 0
+            ai.ChooseMove(m)
+            for cell,vote in BaselineVotes(ai,m).items():
+                self.assertEqual(ai.votes[cell[0]*size+cell[1]],vote)
+
+class RulesTest(unittest.TestCase):
+    def Place(self,m,cells,v):
+        for r,c in cells:
+            m.SetCell(r,c,v)
+
+    def testStandardCapturesEveryPair(self):
+        m = PenteModel(13)
+        self.Place(m,[(5,6),(5,7),(6,5),(7,5)],2)
+        self.Place(m,[(5,8),(8,5)],1)
+        m.TakeTurn(5,5)
+        self.assertEqual(m.Captures,[2,0])
+        self.assertEqual((m.M[5,6],m.M[6,5]),(0,0))
+
+    def testKeryo(self):
+        m = PenteModel(13,rules=KERYO)
+        self.Place(m,[(5,6),(5,7),(5,8)],2)
+        self.Place(m,[(5,9)],1)
+        m.TakeTurn(5,5)
+        self.assertEqual(m.Captures,[3,0])   #counted in pieces
+        m.Captures = [14,0]
+        m.gameWon()
+        self.assertEqual(m.Winner,None)
+        m.Captures = [15,0]
+        m.gameWon()
+        self.assertEqual(m.Winner,0)
+
+    def testGomoku(self):
+        m = PenteModel(13,rules=GOMOKU)
+        self.Place(m,[(5,6),(5,7)],2)
+        self.Place(m,[(5,8)],1)
+        m.TakeTurn(5,5)
+        self.assertEqual((m.Captures,m.M[5,6]),([0,0],2))
+
+    def testTournamentOpening(self):
+        m = PenteModel(13,rules=TOURNAMENT)
+        self.assertEqual((m.Legal(5,5),m.Legal(6,6)),(False,True))
+        m.TakeTurn(6,6)
+        m.TakeTurn(5,5)
+        self.assertEqual((m.Legal(8,8),m.Legal(9,6)),(False,True))
+        m.TakeTurn(8,8)
+        self.assertEqual(m.movecount,2)   #not allowed, so nothing happened
+        move = PenteAI(m,player=HUMAN).ChooseMove(m)
+        self.assertTrue(abs(move[0]-6)>2 or abs(move[1]-6)>2)
+
+    def testKeryoPatterns(self):
+        m = PenteModel(13,rules=KERYO)
+        self.Place(m,[(5,6),(5,7),(5,8),(6,5),(7,5)],2)
+        self.Place(m,[(5,9),(8,5)],1)
+        values = Patterns(KERYO)[0]
+        total = sum([values[m.LineKey(5,5,dr,dc)] for dr,dc in DIRECTIONS])
+        self.assertEqual(PatternField(total,PF_CAPTURES),5)   #a three and a pair
+
+class WinTest(unittest.TestCase):
+    def testSameAsFullScan(self):
+        #checking through the last move finds the same winner as looking at the whole board
+        rng = Random(3)
+        for rules in STANDARD,GOMOKU,KERYO:
+            for game in range(5):
+                m = PenteModel(11,rules=rules)
+                while m.Winner is None and m.LegalMoves():
+                    m.TakeTurn(*rng.choice(sorted(m.LegalMoves())))
+                    m.gameWon()
+                    m.CalcStats()
+                    winner = None
+                    for p in range(2):
+                        if len(m.Runs[p][MAXRUN])>0 or \
+                           (m.MAXCAPTURES is not None and m.Captures[p]>=m.MAXCAPTURES):
+                            winner = p
+                    self.assertEqual(m.Winner,winner)
+
+    def testSixInARow(self):
+        m = Position(["XXX.XX.",".......","OOOO...",".......",".......",".......","......."])
+        m.lastmove = 0,3
+        m.SetCell(0,3,1)
+        m.gameWon()
+        self.assertEqual(m.Winner,0)
+
+class LegalMovesTest(unittest.TestCase):
+    def testSameAsLegal(self):
+        #the empty cells kept up to date through moves and captures are the ones Legal() allows
+        rng = Random(5)
+        for rules in STANDARD,KERYO,TOURNAMENT:
+            m = PenteModel(13,rules=rules)
+            for i in range(120):
+                cells = sorted(m.LegalMoves())
+                self.assertEqual(cells,[(r,c) for r in range(13) for c in range(13) if m.Legal(r,c)])
+                self.assertEqual(sorted(m.Clone().LegalMoves()),cells)
+                m.TakeTurn(*rng.choice(cells))
+                m.gameWon()
+                if m.Winner is not None:
+                    m.Reset()
+
+    def testSparse(self):
+        m = PenteModel(41)
+        self.assertEqual((m.empty,m.LegalMoves()),(None,[(20,20)]))
+
+class MoveChoiceTest(unittest.TestCase):
+    def Game(self,seed):
+        m = PenteModel(13)
+        rng = Random(seed)
+        ais = [PenteAI(m,player=p,rng=rng) for p in range(2)]
+        moves = []
+        while m.Winner is None and len(moves) < 40:
+            move = ais[m.Turn].ChooseMove(m)
+            moves.append(move)
+            m.TakeTurn(*move)
+            m.gameWon()
+        return moves
+
+    def testSeeded(self):
+        self.assertEqual(self.Game(7),self.Game(7))
+        self.assertNotEqual(self.Game(7),self.Game(8))
+
+    def testBestVote(self):
+        #the move is always one of the legal cells with the most votes
+        rng = Random(8)
+        for trial in range(10):
+            m = RandomModel(9,rng,0.3)
+            ai = PenteAI(m,rng=rng)
+            r,c = ai.ChooseMove(m)
+            votes = [ai.votes[row*9+col] for row,col in m.LegalMoves()]
+            self.assertTrue((r,c) in m.LegalMoves())
+            self.assertEqual(ai.votes[r*9+c],max(votes))
+
+    def testDeadline(self):
+        #a tight deadline is kept to on a big board, with every cell empty or only the ones near
+        #the pieces to look at
+        rng = Random(9)
+        Patterns()
+        for sparse in (False,True):
+            m = RandomModel(100,rng,0.03,sparse=sparse)
+            ai = PenteAI(m,rng=rng)
+            ai.SOLVENODES = 1000
+            started = time.time()
+            r,c = ai.ChooseMove(m,started+0.02)
+            self.assertTrue(time.time()-started < 0.04)
+            self.assertTrue(m.Legal(r,c))
+
+class CloneTest(unittest.TestCase):
+    def testIndependent(self):
+        m = RandomModel(13,Random(1),0.3)
+        c = m.Clone()
+        self.assertEqual(list(c.M.Pieces()),list(m.M.Pieces()))
+        c.TakeTurn(*c.LegalMoves()[0])
+        self.assertNotEqual(list(c.M.Pieces()),list(m.M.Pieces()))
+        self.assertEqual(m.Lines,RandomModel(13,Random(1),0.3).Lines)
+
+    def testNothingRebuilt(self):
+        #cloning copies the lines and shares the runs, it doesn't work them out again
+        m = RandomModel(19,Random(2),0.3)
+        def fail(*args):
+            raise AssertionError("Clone rebuilt something")
+        saved = PenteModel.CalcLines,PenteModel.CalcStats,PenteModel.__setstate__
+        PenteModel.CalcLines = PenteModel.CalcStats = PenteModel.__setstate__ = fail
+        try:
+            c = m.Clone()
+        finally:
+            PenteModel.CalcLines,PenteModel.CalcStats,PenteModel.__setstate__ = saved
+        self.assertEqual(c.Lines,m.Lines)
+        self.assertTrue(c.Runs[1][2] is m.Runs[1][2])
+
+    def testMatrixCopies(self):
+        for M in Matrix(7,0),SparseMatrix(7):
+            M[3,4] = 2
+            copy = M.Copy()
+            copy[3,4] = 1
+            self.assertEqual((M[3,4],copy[3,4]),(2,1))
+
+class PickleTest(unittest.TestCase):
+    def testModel(self):
+        for kw in {},{"sparse":True},{"rules":KERYO}:
+            m = RandomModel(13,Random(3),0.3,**kw)
+            m.Captures = [2,1]
+            m2 = pickle.loads(pickle.dumps(m,2))
+            self.assertEqual(list(m2.M.Pieces()),list(m.M.Pieces()))
+            self.assertEqual(m2.Lines,m.Lines)
+            self.assertEqual(repr(m2.Runs),repr(m.Runs))
+            self.assertEqual((m2.Captures,m2.Turn,m2.rules),(m.Captures,m.Turn,m.rules))
+
+    def testMatrixValues(self):
+        #a Matrix can hold anything, not just pieces
+        for filler in 0,1000,10**20,0.5,None,"x":
+            M = Matrix(3,filler)
+            M[1,2] = 1
+            for protocol in 0,2:
+                self.assertEqual(pickle.loads(pickle.dumps(M,protocol)).matrix,M.matrix)
+
+class BackendTest(unittest.TestCase):
+    def testSameVotes(self):
+        #the computer weighs up a position the same way whichever way the board is stored
+        rng = Random(4)
+        for trial in range(20):
+            size = rng.choice([7,9,13])
+            fill = rng.choice([0.1,0.3,0.5])
+            votes = []
+            for kw in {},{"sparse":True}:
+                m = RandomModel(size,Random(trial),fill,**kw)
+                ai = PenteAI(m)
+                ai.SOLVENODES = 0
+                ai.ChooseMove(m)
+                votes.append(dict([(cell,ai.votes[cell[0]*size+cell[1]]) for cell in m.LegalMoves()]))
+            for other in votes[1:]:
+                for cell in other:
+                    self.assertEqual(other[cell],votes[0][cell])
+
+def PlayInPool(args):
+    #make a move in each of the positions in a BoardPool, in another process
+    pool,lo,hi = args
+    for i in range(lo,hi):
+        m = pool.Load(i)
+        m.TakeTurn(*sorted(m.LegalMoves())[0])
+        pool.Store(i,m)
+
+class BoardPoolTest(unittest.TestCase):
+    def Models(self):
+        rng = Random(7)
+        models = []
+        for i in range(8):
+            m = PenteModel(9)
+            for k in range(rng.randrange(5,30)):
+                m.TakeTurn(rng.randrange(9),rng.randrange(9))
+                m.gameWon()
+            models.append(m)
+        return models
+
+    def testStoreLoad(self):
+        models = self.Models()
+        pool = BoardPool(len(models),9)
+        for i,m in enumerate(models):
+            pool.Store(i,m)
+        for i,m in enumerate(models):
+            loaded = pool.Load(i)
+            self.assertEqual(list(loaded.M.Pieces()),list(m.M.Pieces()))
+            self.assertEqual((loaded.Captures,loaded.Turn,loaded.Winner,loaded.lastmove,loaded.movecount),
+                             (m.Captures,m.Turn,m.Winner,m.lastmove,m.movecount))
+            self.assertEqual(loaded.Lines,m.Lines)
+        if numpy is not None:
+            self.assertEqual(pool.Boards().tolist(),[m.M.matrix for m in models])
+            self.assertEqual(pool.Captures().tolist(),[m.Captures for m in models])
+
+    def testOtherProcesses(self):
+        models = self.Models()
+        pool = BoardPool(len(models),9)
+        for i,m in enumerate(models):
+            pool.Store(i,m)
+        workers = [multiprocessing.Process(target=PlayInPool,args=((pool,lo,lo+4),)) for lo in (0,4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        for i,m in enumerate(models):
+            m.TakeTurn(*sorted(m.LegalMoves())[0])
+            self.assertEqual(list(pool.Load(i).M.Pieces()),list(m.M.Pieces()))
+
+    def testTooBig(self):
+        self.assertRaises(ValueError,BoardPool,1,128)
+
+class SolverTest(unittest.TestCase):
+    def Position(self,stones,turn,captures=(0,0),rules=STANDARD):
+        m = PenteModel(13,rules=rules)
+        for r,c,p in stones:
+            m.PlacePiece(r,c,p)
+        m.Turn = turn
+        m.Captures = list(captures)
+        return m
+
+    def testWins(self):
+        m = self.Position([(6,4,0),(6,5,0),(6,6,0),(6,7,0),(0,0,1),(12,12,1),(0,12,1)],0)
+        self.assertEqual(PenteSolver(m,100).Solve()[0],True)   #five in a row next move
+        m = self.Position([(6,5,0),(6,6,0),(6,7,0),(0,0,1),(12,12,1)],0)
+        self.assertEqual(PenteSolver(m,3000).Solve()[0],True)  #open three makes an open four
+        m = self.Position([(6,5,1),(6,6,1),(6,7,0),(9,9,0)],0,(4,0))
+        self.assertEqual(PenteSolver(m,100).Solve(),(True,(6,4)))  #fifth capture
+
+    def testNoWin(self):
+        #has to block the four, and can't win after that
+        m = self.Position([(6,4,1),(6,5,1),(6,6,1),(6,7,1),(3,3,0)],0)
+        self.assertNotEqual(PenteSolver(m,3000).Solve()[0],True)
+
+    def testLeavesModelAlone(self):
+        m = self.Position([(6,5,0),(6,6,0),(6,7,0),(0,0,1),(12,12,1)],0)
+        pieces = list(m.M.Pieces())
+        PenteSolver(m,500).Solve()
+        self.assertEqual(list(m.M.Pieces()),pieces)
+
+    def testTournamentKey(self):
+        #the same pieces with a different number of moves made allow different moves
+        m = self.Position([(6,6,0),(5,5,1)],0,rules=TOURNAMENT)
+        keys = []
+        for movecount in 2,4:
+            m.movecount = movecount
+            keys.append(PenteSolver(m).Key())
+        self.assertNotEqual(keys[0],keys[1])
+
+    def testOffByDefault(self):
+        self.assertEqual(PenteAI.SOLVENODES,0)
+
+class PatternTest(unittest.TestCase):
+    def testMatchesCalcStats(self):
+        #the tables say how many runs a piece adds, which is what CalcStats counts after placing it
+        rng = Random(5)
+        values = Patterns()[0]
+        for trial in range(10):
+            m = RandomModel(rng.choice([7,9,13]),rng,0.4)
+            ai = PenteAI(m)
+            for r,c in sorted(m.LegalMoves())[:15]:
+                for p in 0,1:
+                    total = sum([values[PlayerKey(m.LineKey(r,c,dr,dc),p)] for dr,dc in DIRECTIONS])
+                    before = [len(runs) for runs in m.Runs[p][1:]]
+                    openbefore = [ai.OpenRuns(m,m.Runs[p],p,n) for n in 3,4]
+                    m.SetCell(r,c,p+1)
+                    m.CalcStats()
+                    after = [len(runs) for runs in m.Runs[p][1:]]
+                    openafter = [ai.OpenRuns(m,m.Runs[p],p,n) for n in 3,4]
+                    captures = m.Clone().CheckCaptures(r,c,p)
+                    m.SetCell(r,c,0)
+                    m.CalcStats()
+                    for n,field in (3,PF_THREES),(4,PF_FOURS),(5,PF_FIVES):
+                        self.assertEqual(after[n-1]-before[n-1],PatternField(total,field))
+                    self.assertEqual(openafter[0]-openbefore[0],PatternField(total,PF_OPENTHREES))
+                    self.assertEqual(openafter[1]-openbefore[1],PatternField(total,PF_OPENFOURS))
+                    self.assertEqual(captures,PatternField(total,PF_CAPTURES))
+
+class PatternCacheTest(unittest.TestCase):
+    def setUp(self):
+        #work in a scratch directory, with quick fake tables
+        self.saved = pente.PATTERNDIRS,pente._patterns,pente._loaders,pente.MakePatterns
+        self.scratch = tempfile.mkdtemp()
+        pente._patterns,pente._loaders = {},{}
+        def MakePatterns(rules):
+            self.made += 1
+            return array('i',[7])*(1<<20),array('B',[1])*(1<<20)
+        pente.MakePatterns = MakePatterns
+        self.made = 0
+
+    def tearDown(self):
+        pente.PATTERNDIRS,pente._patterns,pente._loaders,pente.MakePatterns = self.saved
+        shutil.rmtree(self.scratch)
+
+    def testFallback(self):
+        blocked = os.path.join(self.scratch,"file")
+        open(blocked,"w").close()   #can't make a directory inside a file
+        pente.PATTERNDIRS = [os.path.join(blocked,"pente"),os.path.join(self.scratch,"pente")]
+        Patterns(KERYO)
+        self.assertTrue(os.path.exists(os.path.join(self.scratch,"pente","patterns-keryo.dat")))
+        pente._patterns = {}
+        self.assertEqual(Patterns(KERYO)[0][12345],7)
+        self.assertEqual(self.made,1)   #the second time it was read back from the file
+
+    def testNowhereToSave(self):
+        blocked = os.path.join(self.scratch,"file")
+        open(blocked,"w").close()
+        pente.PATTERNDIRS = [os.path.join(blocked,"pente")]
+        stderr,sys.stderr = sys.stderr,StringIO.StringIO()
+        try:
+            Patterns(GOMOKU)
+            message = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertTrue("Can't save the pattern tables" in message)
+
+    def testDeadlineDoesntWait(self):
+        #with a deadline, the move doesn't wait for the tables to be worked out, but they're
+        #loaded in the background for next time
+        pente.PATTERNDIRS = [os.path.join(self.scratch,"pente")]
+        finish = threading.Event()
+        def MakePatterns(rules):
+            finish.wait(10)   #as slow as working them out for real, until the move is made
+            return array('i',[0])*(1<<20),array('B',[0])*(1<<20)
+        pente.MakePatterns = MakePatterns
+        m = RandomModel(19,Random(10),0.2)
+        ai = PenteAI(m)
+        ai.SOLVENODES = 1000
+        try:
+            started = time.time()
+            r,c = ai.ChooseMove(m,started+0.05)
+            elapsed = time.time()-started
+        finally:
+            finish.set()
+            for loader in pente._loaders.values():
+                loader.join()
+        self.assertTrue(elapsed < 0.1)
+        self.assertTrue(m.Legal(r,c))
+        self.assertTrue(tuple(STANDARD.Signature()) in pente._patterns)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+# Tests for tournament.py.  Run from the top of the repository with
+#   python -m unittest discover -s tests
+
+import os, sys, math, shutil, tempfile, unittest
+from optparse import Values
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+import pente, tournament
+
+OPTIONS = Values({"games":4,"seed":1,"size":9,"rules":"standard","opening":4,"maxmoves":40})
+
+class PlayersTest(unittest.TestCase):
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp()
+    def tearDown(self):
+        shutil.rmtree(self.scratch)
+
+    def Write(self,name,text):
+        filename = os.path.join(self.scratch,name)
+        f = open(filename,"w")
+        f.write(text)
+        f.close()
+        return filename
+
+    def testReadPlayers(self):
+        self.Write("w.cfg","[Weights]\nk = 7\n")
+        filename = self.Write("players.cfg","[default]\n[tuned]\nweights = w.cfg\nsolvenodes = 50\nj = 20\n")
+        players = tournament.ReadPlayers(filename)
+        self.assertEqual(players,[("default",{},pente.PenteAI.SOLVENODES),("tuned",{"K":7,"J":20.0},50)])
+
+    def testUnknownSetting(self):
+        filename = self.Write("players.cfg","[default]\nz = 1\n")
+        self.assertRaises(ValueError,tournament.ReadPlayers,filename)
+
+class JobsTest(unittest.TestCase):
+    def testJobs(self):
+        players = [("a",{},0),("b",{},0),("c",{},0)]
+        jobs = tournament.Jobs(players,OPTIONS)
+        self.assertEqual(len(jobs),3*OPTIONS.games)
+        self.assertEqual(len(set([job[0] for job in jobs])),len(jobs))   #keys are unique
+        ab = [job for job in jobs if job[0].startswith("a vs b")]
+        #each player goes first in half the games, and both games of a pair get the same seed
+        self.assertEqual([job[1][0][0] for job in ab],["a","b","a","b"])
+        self.assertEqual(ab[0][2],ab[1][2])
+        self.assertNotEqual(ab[0][2],ab[2][2])
+
+    def testPlayGame(self):
+        players = [("a",{},0),("b",{"J":40},0)]
+        job = tournament.Jobs(players,OPTIONS)[0]
+        result = tournament.PlayGame(job)
+        self.assertEqual(result["key"],job[0])
+        self.assertEqual(result["players"],["a","b"])
+        self.assertTrue(result["winner"] in (0,1,None))
+        self.assertTrue(0 < result["moves"] <= OPTIONS.maxmoves)
+        self.assertEqual(tournament.PlayGame(job),result)   #same seed, same game
+
+class RatingsTest(unittest.TestCase):
+    def Result(self,first,second,winner):
+        return {"players":[first,second],"winner":winner}
+
+    def testEven(self):
+        results = [self.Result("a","b",0),self.Result("b","a",0),self.Result("a","b",None)]
+        elo,errors = tournament.Ratings(["a","b"],results)
+        self.assertAlmostEqual(elo[0],0)
+        self.assertAlmostEqual(elo[1],0)
+        self.assertTrue(errors[1] > 0)
+
+    def testStronger(self):
+        #b wins 3 out of 4, plus the extra draw: a score of 3.5/5, about 147 Elo
+        results = [self.Result("a","b",1),self.Result("b","a",0),self.Result("a","b",1),self.Result("b","a",1)]
+        elo,errors = tournament.Ratings(["a","b"],results)
+        self.assertAlmostEqual(elo[1],-400*math.log10(1/0.7-1),3)
+
+    def testAllWins(self):
+        #ratings stay finite when somebody wins every game
+        results = [self.Result("a","b",0)]*10
+        elo,errors = tournament.Ratings(["a","b"],results)
+        self.assertTrue(-1000 < elo[1] < 0)
+
+if __name__ == "__main__":
+    unittest.main()
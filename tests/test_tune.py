@@ -0,0 +1,66 @@
+# Tests for tune.py.  Run from the top of the repository with
+#   python -m unittest discover -s tests
+
+import os, sys, shutil, tempfile, unittest
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+import numpy
+import pente, tune
+
+class SelfPlayTest(unittest.TestCase):
+    def testPlayGame(self):
+        weights = dict([(name,getattr(pente.PenteAI,name)) for name in pente.PenteAI.WEIGHTS])
+        boards,captures,moves,results = tune.PlayGame((1,9,weights,4,30))
+        count = len(results)
+        self.assertTrue(0 < count <= 30)
+        self.assertEqual((boards.shape,captures.shape,moves.shape),((count,9,9),(count,2),(count,2)))
+        for board,(r,c) in zip(boards,moves):
+            self.assertEqual(board[r,c],0)   #every move is onto an empty cell
+        #the player to move is always 2, so they've made as many moves as the other player, or one fewer
+        for board in boards:
+            self.assertTrue(0 <= (board==1).sum()-(board==2).sum() <= 1 or captures.any())
+        self.assertEqual(tune.PlayGame((1,9,weights,4,30))[2].tolist(),moves.tolist())   #same seed, same game
+
+    def testSwapped(self):
+        board = numpy.array([[0,1],[2,1]],numpy.int8)
+        self.assertEqual(tune.Swapped(board).tolist(),[[0,2],[1,2]])
+
+class FitTest(unittest.TestCase):
+    def setUp(self):
+        weights = dict([(name,getattr(pente.PenteAI,name)) for name in pente.PenteAI.WEIGHTS])
+        boards,captures,moves,results = tune.PlayGame((2,9,weights,4,40))
+        tune.data = boards,captures,moves
+
+    def tearDown(self):
+        tune.data = None
+
+    def testGradient(self):
+        #the gradient matches the change in log likelihood for a small change in each weight
+        names = ['I','J','K','P']
+        values = numpy.array([5.0,12.0,4.0,10.0])
+        index = numpy.arange(len(tune.data[0]))
+        loglik,grad,count = tune.Gradient((names,values,{'A':-500},10.0,index))
+        self.assertEqual(count,len(index))
+        for i in range(len(names)):
+            step = numpy.zeros(len(names))
+            step[i] = 1e-4
+            up = tune.Gradient((names,values+step,{'A':-500},10.0,index))[0]
+            down = tune.Gradient((names,values-step,{'A':-500},10.0,index))[0]
+            self.assertAlmostEqual((up-down)/2e-4,grad[i],3)
+
+class WeightsFileTest(unittest.TestCase):
+    def testWriteWeights(self):
+        scratch = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(scratch,"pente.cfg")
+            f = open(filename,"w")
+            f.write("[Versions]\nbuild = 5\n\n[Weights]\nj = 1\n")
+            f.close()
+            weights = dict([(name,i+0.5) for i,name in enumerate(pente.PenteAI.WEIGHTS)])
+            tune.WriteWeights(weights,filename)
+            self.assertEqual(pente.ReadWeights(filename),weights)
+            self.assertTrue("build = 5" in open(filename).read())   #the rest of the file is kept
+        finally:
+            shutil.rmtree(scratch)
+
+if __name__ == "__main__":
+    unittest.main()
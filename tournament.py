@@ -0,0 +1,203 @@
+# Tournament script for the pente AI
+#
+# Plays different settings of the computer player against each other, every player against every
+# other one, the same number of times each way round so neither gets the first move more often.
+# Games are spread over every core on the machine, and every result is saved as soon as it comes
+# in, so a long tournament that gets stopped can be carried on later by running the same command.
+# At the end it prints each player's results and Elo rating, with 95% confidence intervals,
+# relative to the first player.
+#
+# The players are sections of a config file, e.g.
+#   [default]
+#   [tuned]
+#   weights = pente.cfg
+#   [nosolver]
+#   solvenodes = 0
+#   j = 20
+# where weights is a config file to read the [Weights] from (see tune.py), solvenodes is the
+# PenteAI.SOLVENODES to use, and any of the weights a, f-q can be given as well.
+#
+# Usage:
+#   python tournament.py <players.cfg> [options]
+# Run "python tournament.py --help" for the options.
+
+import os, sys, time, math, random, json, ConfigParser, multiprocessing
+from optparse import OptionParser
+import numpy
+import pente
+
+def ReadPlayers(filename):
+    #returns a list of (name,weights,solvenodes) for each player in the config file, in order
+    cp = ConfigParser.ConfigParser()
+    if not cp.read(filename):
+        raise IOError("can't read %s" % filename)
+    players = []
+    for name in cp.sections():
+        weights = {}
+        solvenodes = pente.PenteAI.SOLVENODES
+        for option,value in cp.items(name):
+            if option=="weights":
+                weights.update(pente.ReadWeights(os.path.join(os.path.dirname(filename),value)))
+            elif option=="solvenodes":
+                solvenodes = int(value)
+            elif option.upper() in pente.PenteAI.WEIGHTS:
+                weights[option.upper()] = float(value)
+            else:
+                raise ValueError("unknown setting %s for player %s" % (option,name))
+        players.append((name,weights,solvenodes))
+    return players
+
+def PlayGame(args):
+    #play one game, returns a dictionary of the job's key, who won (0 or 1 for the players in
+    #the order given, None for a draw), the captures each player made and the number of moves
+    key,players,seed,size,rules,opening,maxmoves = args
+    rng = random.Random(seed)   #same opening for both games of a pair, PenteAI breaks ties with it too
+    m = pente.PenteModel(size,rules=pente.RULES[rules])
+    ais = []
+    for p,(name,weights,solvenodes) in enumerate(players):
+        ai = pente.PenteAI(m,weights,p,rng)
+        ai.SOLVENODES = solvenodes
+        ais.append(ai)
+    moves = 0
+    while m.Winner is None and moves < maxmoves and m.LegalMoves():
+        if moves < opening:
+            #start with a few random moves near the middle, so the games aren't all the same
+            spread = 2
+            if m.rules.tournament and m.movecount==2:
+                spread = 3   #the tournament rule keeps this piece out of the middle 5x5
+            r,c = [size/2+rng.randint(-spread,spread) for i in range(2)]
+            if not m.Legal(r,c):
+                continue
+        else:
+            r,c = ais[m.Turn].ChooseMove(m)
+        m.TakeTurn(r,c)
+        m.gameWon()
+        moves += 1
+    return {"key":key,"players":[p[0] for p in players],"winner":m.Winner,
+            "captures":list(m.Captures),"moves":moves}
+
+def Jobs(players,options):
+    #every game to be played: each pair of players plays options.games games, changing who goes
+    #first each game
+    jobs = []
+    for i in range(len(players)):
+        for j in range(i+1,len(players)):
+            for game in range(options.games):
+                first,second = (players[i],players[j]),(players[j],players[i])
+                order = (first,second)[game % 2]
+                key = "%s vs %s #%d" % (players[i][0],players[j][0],game)
+                seed = hash((options.seed,players[i][0],players[j][0],game/2)) & 0x7fffffff
+                jobs.append((key,order,seed,options.size,options.rules,options.opening,options.maxmoves))
+    return jobs
+
+def Ratings(names,results):
+    #maximum likelihood Elo ratings, and their standard errors, relative to the first player.
+    #Draws count as half a win each.  Every pair also gets one extra drawn game, so the ratings
+    #stay finite when somebody wins all their games
+    n = len(names)
+    index = dict([(name,i) for i,name in enumerate(names)])
+    games = []   #(i,j,score for i)
+    for r in results:
+        i,j = index[r["players"][0]],index[r["players"][1]]
+        if r["winner"] is None:
+            games.append((i,j,0.5))
+        else:
+            games.append((i,j,1.0-r["winner"]))
+    for i in range(n):
+        for j in range(i+1,n):
+            games.append((i,j,0.5))
+    s = numpy.zeros(n)   #ratings in natural log-odds
+    for step in range(50):
+        grad,hess = numpy.zeros(n),numpy.zeros((n,n))
+        for i,j,x in games:
+            p = 1/(1+math.exp(s[j]-s[i]))
+            grad[i] += x-p
+            grad[j] -= x-p
+            w = p*(1-p)
+            hess[i,i] -= w
+            hess[j,j] -= w
+            hess[i,j] += w
+            hess[j,i] += w
+        # ratings are only known relative to each other, so keep the first one at 0
+        change = numpy.zeros(n)
+        if n > 1:
+            change[1:] = numpy.linalg.solve(hess[1:,1:],-grad[1:])
+        s += change
+        if abs(change).max() < 1e-9:
+            break
+    errors = numpy.zeros(n)
+    if n > 1:
+        errors[1:] = numpy.sqrt(numpy.diag(numpy.linalg.inv(-hess[1:,1:])))
+    scale = 400/math.log(10)
+    return s*scale,errors*scale
+
+def Report(names,results):
+    #print each player's results and rating
+    elo,errors = Ratings(names,results)
+    print "%-16s %6s %6s %6s %6s %7s %9s %14s" % ("player","games","wins","losses","draws","score","captures","elo")
+    for i,name in enumerate(names):
+        games = wins = losses = draws = captures = 0
+        for r in results:
+            if name in r["players"]:
+                p = r["players"].index(name)
+                games += 1
+                captures += r["captures"][p]
+                if r["winner"] is None:
+                    draws += 1
+                elif r["winner"]==p:
+                    wins += 1
+                else:
+                    losses += 1
+        score = 0
+        if games:
+            score = 100.0*(wins+0.5*draws)/games
+        print "%-16s %6d %6d %6d %6d %6.1f%% %9d %7.0f +/- %3.0f" % (name,games,wins,losses,draws,score,
+                                                                    captures,elo[i],1.96*errors[i])
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="%prog <players.cfg> [options]")
+    parser.add_option("--games",type="int",default=20,help="games between each pair of players [%default]")
+    parser.add_option("--results",default=None,help="file to save results in, and carry on from [<players>.results]")
+    parser.add_option("--workers",type="int",default=multiprocessing.cpu_count(),help="number of processes [%default]")
+    parser.add_option("--seed",type="int",default=1,help="random seed [%default]")
+    parser.add_option("--size",type="int",default=pente.SIZE,help="board size [%default]")
+    parser.add_option("--rules",default="standard",choices=sorted(pente.RULES),help="rules to play by [%default]")
+    parser.add_option("--opening",type="int",default=4,help="random moves at the start of each game [%default]")
+    parser.add_option("--maxmoves",type="int",default=200,help="call the game a draw after this many moves [%default]")
+    options,args = parser.parse_args()
+    if len(args)<>1:
+        parser.error("expected a players config file")
+    players = ReadPlayers(args[0])
+    names = [p[0] for p in players]
+    if len(players) < 2:
+        parser.error("need at least two players")
+    filename = options.results or os.path.splitext(args[0])[0]+".results"
+
+    # pick up the results saved by an earlier run
+    results = []
+    if os.path.exists(filename):
+        for line in open(filename):
+            if line.strip():
+                results.append(json.loads(line))
+    done = set([r["key"] for r in results])
+    jobs = [job for job in Jobs(players,options) if not job[0] in done]
+    print "%d games to play, %d already played" % (len(jobs),len(results))
+
+    if jobs:
+        started = time.time()
+        out = open(filename,"a")
+        pool = multiprocessing.Pool(options.workers)
+        try:
+            for i,result in enumerate(pool.imap_unordered(PlayGame,jobs)):
+                out.write(json.dumps(result)+"\n")
+                out.flush()   #so it's saved even if we get stopped
+                results.append(result)
+                if (i+1) % 50 == 0:
+                    print "%d/%d games, %.0f sec" % (i+1,len(jobs),time.time()-started)
+            pool.close()
+        except KeyboardInterrupt:
+            pool.terminate()
+            print "Stopped, run again to carry on"
+        pool.join()
+        out.close()
+    Report(names,[r for r in results if r["players"][0] in names and r["players"][1] in names])
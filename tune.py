@@ -0,0 +1,200 @@
+# Weight tuning script for the pente AI
+#
+# The computer picks its moves by adding up votes for each cell, using the weights A, F-Q in
+# PenteAI.  This script plays the computer against itself, keeps every position along with the
+# move that was played and who went on to win, and then fits the weights so the moves played by
+# the winners get as many of the votes as possible (a softmax over the votes on each board,
+# fitted by gradient ascent on minibatches of positions).  The fitted weights are written to the
+# [Weights] section of pente.cfg, where pente.py picks them up.
+#
+# Usage:
+#   python tune.py selfplay <games> <datafile.npz>       play games, save the positions
+#   python tune.py fit <datafile.npz> [more.npz ...]     fit the weights, write them to pente.cfg
+# Run "python tune.py --help" for the options.  Both steps use every core on the machine.
+
+import os, sys, time, random, ConfigParser, multiprocessing
+from optparse import OptionParser
+import numpy
+import pente
+
+# ---------------------------------------------------------------------------------------------
+# Self-play
+# Positions are stored with the player to move as the computer (pieces of value 2), the same
+# way BatchEvaluate expects them, so the human's positions have their colors swapped.
+
+def Swapped(board):
+    #swap the colors of the pieces on a board (an int8 array)
+    result = board.copy()
+    result[board==1] = 2
+    result[board==2] = 1
+    return result
+
+def PlayGame(args):
+    #play one game of the computer against itself, returns arrays of boards, captures, moves, and
+    #results (1 if the player who moved went on to win, -1 if they lost, 0 for no winner)
+    seed,size,weights,opening,maxmoves = args
+    rng = random.Random(seed)   #for the opening, and for PenteAI to break ties with
+    m = pente.PenteModel(size)
+    ais = [pente.PenteAI(m,weights,p,rng) for p in range(m.NumPlayers)]
+    for ai in ais:
+        ai.SOLVENODES = 0   #just the votes, which is what we're tuning
+    boards,captures,moves,players = [],[],[],[]
+    while m.Winner is None and len(moves) < maxmoves:
+        p = m.Turn
+        if len(moves) < opening:
+            #start with a few random moves near the middle, so the games aren't all the same
+            r,c = [size/2+rng.randint(-2,2) for i in range(2)]
+            if m.M[r,c]:
+                continue
+        else:
+            r,c = ais[p].ChooseMove(m)
+        board = numpy.array([[m.M[row,col] for col in range(size)] for row in range(size)],numpy.int8)
+        if p==pente.HUMAN:
+            board = Swapped(board)
+        boards.append(board)
+        captures.append([m.Captures[1-p],m.Captures[p]])  #in the order (opponent,mover)
+        moves.append((r,c))
+        players.append(p)
+        m.TakeTurn(r,c)
+        m.gameWon()
+    results = [0]*len(players)
+    if m.Winner is not None:
+        results = [(p==m.Winner)*2-1 for p in players]
+    return (numpy.array(boards,numpy.int8).reshape(-1,size,size),numpy.array(captures,numpy.int8).reshape(-1,2),
+            numpy.array(moves,numpy.int16).reshape(-1,2),numpy.array(results,numpy.int8))
+
+def SelfPlay(games,filename,options,weights):
+    pool = multiprocessing.Pool(options.workers)
+    jobs = [(options.seed+i,options.size,weights,options.opening,options.maxmoves) for i in range(games)]
+    parts = []
+    started = time.time()
+    for i,part in enumerate(pool.imap_unordered(PlayGame,jobs)):
+        parts.append(part)
+        if (i+1) % 10 == 0 or i+1 == games:
+            print "%d games, %d positions, %.0f sec" % (i+1,sum([len(p[3]) for p in parts]),time.time()-started)
+    pool.close()
+    data = [numpy.concatenate([p[i] for p in parts]) for i in range(4)]
+    numpy.savez_compressed(filename,boards=data[0],captures=data[1],moves=data[2],results=data[3])
+
+# ---------------------------------------------------------------------------------------------
+# Fitting
+# The votes for a cell are the sum over the weights of weight*feature, plus a fixed part (see
+# pente.BatchFeatures).  The chance of the winner's move being chosen is modelled as the softmax
+# of votes/temperature over the empty cells, and the weights are changed to make that as likely
+# as possible.
+
+data = None   #boards,captures,moves of the positions being fitted, shared with the worker processes
+
+def LoadData(filenames):
+    #load the winners' moves from the data files, unless we've got them already (e.g. from the
+    #process that started us)
+    global data
+    if data is None:
+        boards,captures,moves = [],[],[]
+        for filename in filenames:
+            f = numpy.load(filename)
+            won = f['results'] > 0
+            boards.append(f['boards'][won])
+            captures.append(f['captures'][won])
+            moves.append(f['moves'][won])
+        data = numpy.concatenate(boards),numpy.concatenate(captures),numpy.concatenate(moves)
+
+def Gradient(args):
+    #returns the log likelihood of the moves played in positions index, and its gradient with
+    #respect to each of the weights being tuned
+    names,values,fixed,temperature,index = args
+    boards,captures,moves = data[0][index],data[1][index],data[2][index]
+    runs,features,base,winners = pente.BatchFeatures(boards,captures)
+    count,size = boards.shape[0],boards.shape[-1]
+    votes = base.astype(float)
+    for name,value in zip(names,values)+fixed.items():
+        votes += value*features[name]
+    logits = (votes/temperature).reshape(count,-1)
+    logits[boards.reshape(count,-1)<>0] = -numpy.inf   #only empty cells can be played
+    logits -= logits.max(axis=1)[:,None]
+    prob = numpy.exp(logits)
+    prob /= prob.sum(axis=1)[:,None]
+    played = moves[:,0]*size+moves[:,1]
+    rows = numpy.arange(count)
+    loglik = numpy.log(prob[rows,played]+1e-300).sum()
+    grad = []
+    for name in names:
+        f = features[name].reshape(count,-1)
+        grad.append(((f[rows,played]-(prob*f).sum(axis=1))/temperature).sum())
+    return loglik,numpy.array(grad),count
+
+def Fit(filenames,options,weights):
+    LoadData(filenames)
+    total = len(data[0])
+    if not total:
+        print "No positions won by the player to move in", " ".join(filenames)
+        return None
+    print "%d positions" % total
+    fixed = dict([(name,weights[name]) for name in options.fixed.split(",") if name])
+    names = [name for name in pente.PenteAI.WEIGHTS if not name in fixed]
+    start = numpy.array([weights[name] for name in names],float)
+    values = start.copy()
+    pool = multiprocessing.Pool(options.workers,LoadData,(filenames,))
+    rng = numpy.random.RandomState(options.seed)
+    # Adam: gradient ascent with a separate, self-adjusting step size for each weight
+    mean,var = numpy.zeros(len(names)),numpy.zeros(len(names))
+    for step in range(1,options.iterations+1):
+        batch = rng.choice(total,min(total,options.batch),replace=False)
+        chunks = numpy.array_split(batch,options.workers*4)
+        results = pool.map(Gradient,[(names,values,fixed,options.temperature,c) for c in chunks if len(c)])
+        loglik = sum([r[0] for r in results])
+        count = sum([r[2] for r in results])
+        grad = sum([r[1] for r in results])/count - options.l2*(values-start)
+        mean = 0.9*mean+0.1*grad
+        var = 0.999*var+0.001*grad*grad
+        values += options.rate * (mean/(1-0.9**step)) / (numpy.sqrt(var/(1-0.999**step))+1e-8)
+        if step % 10 == 0 or step == options.iterations:
+            print "step %d: average log likelihood %.4f" % (step,loglik/count)
+    pool.close()
+    result = dict(fixed)
+    for name,value in zip(names,values):
+        result[name] = round(value,2)
+    return result
+
+def WriteWeights(weights,filename):
+    #store the weights in the [Weights] section of the config file, keeping everything else in it
+    cp = ConfigParser.ConfigParser()
+    cp.read(filename)
+    if not cp.has_section("Weights"):
+        cp.add_section("Weights")
+    for name in pente.PenteAI.WEIGHTS:
+        cp.set("Weights",name.lower(),str(weights[name]))
+    f = open(filename,"w")
+    cp.write(f)
+    f.close()
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="%prog selfplay <games> <datafile.npz>\n       %prog fit <datafile.npz> [more.npz ...]")
+    parser.add_option("--config",default=pente.CONFIGFILE,help="config file to read the weights from and write them to [%default]")
+    parser.add_option("--workers",type="int",default=multiprocessing.cpu_count(),help="number of processes [%default]")
+    parser.add_option("--seed",type="int",default=1,help="random seed [%default]")
+    parser.add_option("--size",type="int",default=pente.SIZE,help="selfplay: board size [%default]")
+    parser.add_option("--opening",type="int",default=4,help="selfplay: random moves at the start of each game [%default]")
+    parser.add_option("--maxmoves",type="int",default=200,help="selfplay: give up on a game after this many moves [%default]")
+    parser.add_option("--iterations",type="int",default=200,help="fit: number of steps [%default]")
+    parser.add_option("--batch",type="int",default=20000,help="fit: positions per step [%default]")
+    parser.add_option("--rate",type="float",default=0.5,help="fit: step size [%default]")
+    parser.add_option("--temperature",type="float",default=10.0,help="fit: votes per unit of log likelihood [%default]")
+    parser.add_option("--l2",type="float",default=0.001,help="fit: pull towards the starting weights [%default]")
+    parser.add_option("--fixed",default="A",help="fit: comma separated weights to leave alone [%default]")
+    options,args = parser.parse_args()
+    if len(args) < 2 or args[0] not in ("selfplay","fit") or (args[0]=="selfplay" and len(args)<>3):
+        parser.error("expected selfplay <games> <datafile.npz>, or fit <datafile.npz> ...")
+
+    # start from the weights in the config file, or the ones in PenteAI if it doesn't have them
+    weights = dict([(name,getattr(pente.PenteAI,name)) for name in pente.PenteAI.WEIGHTS])
+    weights.update(pente.ReadWeights(options.config))
+    if args[0]=="selfplay":
+        SelfPlay(int(args[1]),args[2],options,weights)
+    else:
+        tuned = Fit(args[1:],options,weights)
+        if tuned:
+            for name in pente.PenteAI.WEIGHTS:
+                print "%s: %s -> %s" % (name,weights[name],tuned[name])
+            WriteWeights(tuned,options.config)
+            print "Weights written to", options.config